@@ -83,6 +83,9 @@ def parse_inputs(filename):
         else:
             kwargs['angle_criteria'] = float(kwargs['angle_criteria'])
 
+    if 'backend' in kwargs.keys() and kwargs['backend'] == 'None':
+        kwargs['backend'] = None
+
     if 'active_region_radius' in kwargs.keys():
         kwargs['active_region_radius'] = float(kwargs['active_region_radius'])
 
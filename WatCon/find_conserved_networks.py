@@ -139,7 +139,8 @@ def cluster_coordinates_only(coordinate_list, cluster='hdbscan', min_samples=10,
         - Cluster centers (dict)
     """
     try:
-        coordinate_list = np.array(coordinate_list).reshape(-1,3)
+        #Cluster in float32 -- arrays collected from networks are already float32, so this does not copy them
+        coordinate_list = np.asarray(coordinate_list, dtype=np.float32).reshape(-1,3)
     except:
         print("Couldn't reshape coordinates correctly, check your inputs.")
 
@@ -166,7 +167,7 @@ def cluster_coordinates_only(coordinate_list, cluster='hdbscan', min_samples=10,
         if label != -1:
             cluster_indices = np.where((cluster_labels == label) & (cluster_labels!=-1))[0]
             #cluster_center = [coordinate_list[i] for i in cluster_indices][0]
-            cluster_center = np.mean(np.array([coordinate_list[i] for i in cluster_indices]), axis=0)
+            cluster_center = coordinate_list[cluster_indices].mean(axis=0)
     
             cluster_centers[label] = cluster_center
 
@@ -289,10 +290,8 @@ def create_clustered_network(clusters, max_connection_distance, create_graph=Tru
 
     if create_graph:
         G = nx.Graph()
-        for molecule in clustered_network.water_molecules:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
-        for connection in clustered_network.connections:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+        G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in clustered_network.water_molecules) #have nodes on all oxygens
+        G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in clustered_network.connections)
 
         clustered_network.graph = G
     return clustered_network
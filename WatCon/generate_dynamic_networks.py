@@ -3,14 +3,16 @@ Generate water networks based on dynamical data
 """
 
 import os, sys
+from collections import defaultdict
+from itertools import chain
 import numpy as np
 import MDAnalysis as mda
-from MDAnalysis.analysis import distances
-from joblib import Parallel, delayed  # For parallel processing
+from MDAnalysis.lib import distances
+from joblib import Parallel, delayed, effective_n_jobs  # For parallel processing
 import networkx as nx
+from scipy.sparse import csr_matrix, csgraph
 import matplotlib.pyplot as plt
 
-from scipy.spatial import cKDTree
 from scipy.spatial.distance import pdist, squareform
 import numpy as np
 
@@ -27,7 +29,7 @@ class WaterAtom:
     ----------
     index : int
         PDB atom index
-    coordinates : tuple
+    coordinates : np.ndarray
         Coordinates of atom
     resname : str
         Name of residue. Default is WAT.
@@ -56,7 +58,7 @@ class WaterAtom:
             z-coordinate of position
         """
         self.index = index
-        self.coordinates = (x, y, z)
+        self.coordinates = np.array((x, y, z), dtype=np.float32)
         self.resname = 'WAT'
         self.name = atom_name
         self.resid = residue_number
@@ -112,7 +114,7 @@ class OtherAtom:
     ----------
     index : int
         PDB atom index
-    coordinates : tuple
+    coordinates : np.ndarray
         Coordinates of atom
     resname : str
         Name of residue.
@@ -145,13 +147,410 @@ class OtherAtom:
             Residue number of atom
         """
         self.index = index
-        self.coordinates = (x, y, z)
+        self.coordinates = np.array((x, y, z), dtype=np.float32)
         self.resname = residue_name
         self.msa_resid = msa_residue_number
         self.resid = residue_number
         self.name = atom_name
         self.hbonding = hbonding
+        self.hbonding_type = _classify_protein_atom(atom_name)
   
+#Categories of protein atoms for hydrogen bonding
+HBOND_HEAVY = 0
+HBOND_HYDROGEN = 1
+HBOND_NONE = 2
+
+#Kinds of points in the combined donor/acceptor search
+POINT_WATER_O = 0
+POINT_WATER_H = 1
+POINT_PROTEIN_HEAVY = 2
+POINT_PROTEIN_H = 3
+
+#Network metrics -- analysis_conditions key: (metrics key, WaterNetwork method, whether the method takes a selection, whether it takes a NetworkX backend)
+_METHOD = {
+    'density': ('density', 'get_density', True, False),
+    'connected_components': ('connected_components', 'get_connected_components', True, False),
+    'interaction_counts': ('interaction_counts', 'get_interactions', False, False),
+    'per_residue_interactions': ('per_residue_interaction', 'get_per_residue_interactions', True, False),
+    'characteristic_path_length': ('characteristic_path_length', 'get_CPL', True, False),
+    'graph_entropy': ('entropy', 'get_entropy', True, False),
+    'clustering_coefficient': ('clustering_coefficient', 'get_clustering_coefficient', True, True),
+}
+
+def _classify_protein_atom(atom_name):
+    """
+    Categorize a protein atom by its element as a hydrogen bonding heavy atom (N, O, P, S), a hydrogen, or neither
+
+    Parameters
+    ----------
+    atom_name : str
+        Name of atom
+
+    Returns
+    -------
+    int
+        One of HBOND_HEAVY, HBOND_HYDROGEN or HBOND_NONE
+    """
+    #Element is the first letter of the atom name, skipping PDB-style leading digits (e.g. 1HD2)
+    element = atom_name.lstrip('0123456789')[:1]
+    if element in ('N', 'O', 'P', 'S'):
+        return HBOND_HEAVY
+    elif element == 'H':
+        return HBOND_HYDROGEN
+    return HBOND_NONE
+
+def _stack_waters(waters):
+    """
+    Stack attributes of WaterMolecule objects into contiguous arrays
+
+    Parameters
+    ----------
+    waters : list
+        List of WaterMolecule objects
+
+    Returns
+    -------
+    tuple
+        - (N,3) float32 array of oxygen coordinates
+        - (2*N_H,3) float32 array of hydrogen coordinates (H1, H2 of each water in turn)
+        - array of oxygen indices
+        - array of water resids
+        - array giving the position of the parent water of each hydrogen
+    """
+    has_H = [i for i, mol in enumerate(waters) if mol.H1 is not None]
+
+    #Fill preallocated arrays instead of converting nested lists of tuples
+    O_xyz = np.empty((len(waters), 3), dtype=np.float32)
+    H_xyz = np.empty((2*len(has_H), 3), dtype=np.float32)
+    if len(waters) > 0:
+        np.stack([mol.O.coordinates for mol in waters], out=O_xyz)
+    if len(has_H) > 0:
+        H_xyz[0::2] = np.stack([waters[i].H1.coordinates for i in has_H])
+        H_xyz[1::2] = np.stack([waters[i].H2.coordinates for i in has_H])
+    O_idx = np.fromiter((mol.O.index for mol in waters), dtype=np.int32, count=len(waters))
+    resid = np.array([mol.resid for mol in waters])
+    H_owner = np.repeat(np.array(has_H, dtype=np.int64), 2)
+    return O_xyz, H_xyz, O_idx, resid, H_owner
+
+def _stack_protein(protein):
+    """
+    Stack attributes of OtherAtom objects into contiguous arrays
+
+    Parameters
+    ----------
+    protein : list
+        List of OtherAtom objects
+
+    Returns
+    -------
+    tuple
+        - (N,3) float32 array of coordinates
+        - array of atom indices
+        - array of resids
+        - array of atom names
+        - int8 array of hydrogen bonding categories
+    """
+    xyz = np.empty((len(protein), 3), dtype=np.float32)
+    if len(protein) > 0:
+        np.stack([atm.coordinates for atm in protein], out=xyz)
+    idx = np.fromiter((atm.index for atm in protein), dtype=np.int32, count=len(protein))
+    resid = np.array([atm.resid for atm in protein])
+    name = np.array([atm.name for atm in protein], dtype=str)
+    types = np.fromiter((atm.hbonding_type for atm in protein), dtype=np.int8, count=len(protein))
+    return xyz, idx, resid, name, types
+
+def _bond_angles(v1, v2, box=None):
+    """
+    Compute angles between paired rows of two arrays of vectors
+
+    Parameters
+    ----------
+    v1 : np.ndarray
+        (N,3) array of vectors
+    v2 : np.ndarray
+        (N,3) array of vectors
+    box : array-like, optional
+        Simulation box used to apply the minimum image convention to both vectors. Default is None.
+
+    Returns
+    -------
+    np.ndarray
+        (N,) array of angles in degrees
+    """
+    if box is not None:
+        v1 = distances.minimize_vectors(v1, box)
+        v2 = distances.minimize_vectors(v2, box)
+    #One square root per pair from the product of squared magnitudes
+    cosine = np.einsum('ij,ij->i', v1, v2) / np.sqrt(np.einsum('ij,ij->i', v1, v1) * np.einsum('ij,ij->i', v2, v2))
+    return np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+
+def _bounding_box_mask(coordinates, reference_positions, radius, box=None):
+    """
+    Flag coordinates inside the bounding box of the reference positions expanded by a radius
+
+    Parameters
+    ----------
+    coordinates : np.ndarray
+        (N,3) array of coordinates
+    reference_positions : np.ndarray
+        (M,3) array of reference coordinates, or (3,) array of a single reference point
+    radius : float
+        Distance added to each side of the bounding box
+    box : array-like, optional
+        Simulation box dimensions. Coordinates are wrapped into the box image nearest the reference. Default is None.
+
+    Returns
+    -------
+    np.ndarray
+        (N,) boolean array, True for coordinates which may be within radius of a reference position
+    """
+    #A single reference point (e.g. a center of mass) is a bounding box of zero size
+    reference_positions = np.atleast_2d(reference_positions)
+    box_min = reference_positions.min(axis=0) - radius
+    box_span = reference_positions.max(axis=0) + radius - box_min
+    offset = coordinates - box_min
+
+    if box is not None:
+        box = np.asarray(box, dtype=np.float32)
+        #Only cull in orthorhombic boxes larger than the expanded bounding box
+        if np.any(box[3:] != 90.0) or np.any(box_span >= box[:3]):
+            return np.ones(len(coordinates), dtype=bool)
+        offset = offset - np.floor(offset / box[:3]) * box[:3]
+
+    return ((offset >= 0) & (offset <= box_span)).all(axis=1)
+
+def _capped_pairs(reference, configuration, max_cutoff, box=None):
+    """
+    Find all pairs of atoms within a cutoff, accounting for periodic boundary conditions
+
+    Parameters
+    ----------
+    reference : np.ndarray
+        (N,3) array of coordinates
+    configuration : np.ndarray
+        (M,3) array of coordinates, or None to search pairs within reference
+    max_cutoff : float
+        Distance cutoff
+    box : array-like, optional
+        Simulation box dimensions. Default is None.
+
+    Returns
+    -------
+    np.ndarray
+        (Npairs,2) array of positions in reference and configuration, sorted by the first column
+    """
+    if configuration is None:
+        if len(reference) < 2:
+            return np.empty((0,2), dtype=np.int64)
+        pairs = distances.self_capped_distance(reference, max_cutoff, box=box, return_distances=False)
+    else:
+        if len(reference) == 0 or len(configuration) == 0:
+            return np.empty((0,2), dtype=np.int64)
+        pairs = distances.capped_distance(reference, configuration, max_cutoff, box=box, return_distances=False)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1,2)
+    return pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+
+def _split_pairs(pairs, kind, offsets, first_kind, second_kind):
+    """
+    Select pairs between two kinds of points from a combined neighbor search
+
+    Parameters
+    ----------
+    pairs : np.ndarray
+        (Npairs,2) array of positions in the combined point set
+    kind : np.ndarray
+        Kind of each point in the combined point set
+    offsets : np.ndarray
+        Position of the first point of each kind in the combined point set
+    first_kind : int
+        Kind of point to list first
+    second_kind : int
+        Kind of point to list second
+
+    Returns
+    -------
+    tuple
+        - positions of the first points within their own kind
+        - positions of the second points within their own kind
+    """
+    pair_kind = kind[pairs]
+    forward = (pair_kind[:,0] == first_kind) & (pair_kind[:,1] == second_kind)
+    backward = (pair_kind[:,0] == second_kind) & (pair_kind[:,1] == first_kind)
+
+    first = np.concatenate([pairs[forward,0], pairs[backward,1]]) - offsets[first_kind]
+    second = np.concatenate([pairs[forward,1], pairs[backward,0]]) - offsets[second_kind]
+    order = np.lexsort((second, first))
+    return first[order], second[order]
+
+def _assemble_connections(first_indices, second_indices, first_names, interaction, in_active=None, 
+                          active_region_only=False, backbone=None):
+    """
+    Build connection tuples for a batch of atom pairs
+
+    Parameters
+    ----------
+    first_indices : np.ndarray
+        Atom indices of the first atom in each pair
+    second_indices : np.ndarray
+        Atom indices of the second atom in each pair
+    first_names : np.ndarray
+        Atom names of the first atom in each pair
+    interaction : str
+        Type of interaction ('WAT-WAT' or 'WAT-PROT')
+    in_active : np.ndarray, optional
+        Boolean array marking pairs involving the active site. None if no active site is defined.
+    active_region_only : bool, optional
+        If True, every pair is labelled as active site. Default is False.
+    backbone : np.ndarray, optional
+        Boolean array marking pairs with a protein backbone atom. Only given for 'WAT-PROT' interactions.
+
+    Returns
+    -------
+    list of tuples
+        Connections in the format returned by find_connections
+    """
+    n_pairs = len(first_indices)
+    if active_region_only:
+        site_status = ['active_region'] * n_pairs
+    elif in_active is None:
+        site_status = ['None'] * n_pairs
+    else:
+        site_status = np.where(in_active, 'active_region', 'not_active_region').tolist()
+
+    columns = [np.asarray(first_indices).tolist(), np.asarray(second_indices).tolist(), 
+               np.asarray(first_names).tolist(), [interaction] * n_pairs, site_status]
+    if backbone is not None:
+        columns.append(np.where(backbone, 'backbone', 'side-chain').tolist())
+    return list(zip(*columns))
+
+def _msa_lookup(msa_indexing, resids):
+    """
+    Look up the MSA residue number of each resid
+
+    Parameters
+    ----------
+    msa_indexing : list or None
+        MSA residue numbers, where entry resid-1 belongs to residue resid
+    resids : array-like
+        Residue numbers
+
+    Returns
+    -------
+    list
+        MSA residue number of each resid, or None where msa_indexing has no entry
+    """
+    if msa_indexing is None:
+        return [None] * len(resids)
+
+    msa_arr = np.asarray(msa_indexing, dtype=object)
+    positions = np.asarray(resids, dtype=np.int64) - 1
+
+    #Same bounds as list indexing, so negative positions still count from the end
+    valid = (positions >= -len(msa_arr)) & (positions < len(msa_arr))
+    msa_resids = np.full(len(positions), None, dtype=object)
+    msa_resids[valid] = msa_arr[positions[valid]]
+    return msa_resids.tolist()
+
+def _edge_adjacency(edge_list, n_nodes):
+    """
+    Build an unweighted CSR adjacency matrix from an edge list
+
+    Parameters
+    ----------
+    edge_list : np.ndarray
+        (Nedges,2) array of node positions
+    n_nodes : int
+        Number of nodes
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        (n_nodes, n_nodes) adjacency matrix
+    """
+    adjacency = csr_matrix((np.ones(len(edge_list), dtype=np.int8), (edge_list[:,0], edge_list[:,1])), shape=(n_nodes, n_nodes))
+    adjacency.data[:] = 1
+    return adjacency
+
+def _clustering_coefficients(adjacency):
+    """
+    Compute the clustering coefficient of every node of an undirected graph by triangle counting
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse matrix
+        Symmetric adjacency matrix of the graph. Weights and self-loops are ignored.
+
+    Returns
+    -------
+    np.ndarray
+        Clustering coefficient of each row of the adjacency matrix
+    """
+    #Drop self-loops and weights
+    coo = adjacency.tocoo()
+    off_diagonal = coo.row != coo.col
+    adjacency = csr_matrix((np.ones(np.count_nonzero(off_diagonal), dtype=np.int64), (coo.row[off_diagonal], coo.col[off_diagonal])), shape=coo.shape)
+    adjacency.data[:] = 1
+
+    #Each triangle through a node closes two of its paths of length 2
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    triangles = np.asarray((adjacency @ adjacency).multiply(adjacency).sum(axis=1)).ravel()/2
+    pairs = degree*(degree-1)
+    return np.divide(2*triangles, pairs, out=np.zeros(len(degree)), where=pairs>0)
+
+def _combine_coordinates(coordinates):
+    """
+    Copy per-frame coordinate arrays into one pre-sized float32 array
+
+    Parameters
+    ----------
+    coordinates : list of np.ndarray
+        (n, 3) coordinate arrays
+
+    Returns
+    -------
+    np.ndarray
+        (sum of n, 3) float32 array of all coordinates
+    """
+    sizes = np.fromiter((arr.shape[0] for arr in coordinates), dtype=np.int64, count=len(coordinates))
+    combined = np.empty((int(sizes.sum()), 3), dtype=np.float32)
+    offset = 0
+    for arr, size in zip(coordinates, sizes):
+        combined[offset:offset+size] = arr
+        offset += size
+    return combined
+
+
+def _average_path_length(adjacency, directed=False, block_size=1024):
+    """
+    Compute the average shortest path length between all pairs of nodes of a connected graph
+
+    Shortest paths are computed for blocks of source nodes so that the full 
+    distance matrix is never held in memory.
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse.csr_matrix
+        Adjacency matrix of the graph
+    directed : bool, optional
+        Whether to follow edge directions. Default is False.
+    block_size : int, optional
+        Number of source nodes per block. Default is 1024.
+
+    Returns
+    -------
+    float
+        Average shortest path length (0 for graphs with a single node)
+    """
+    n_nodes = adjacency.shape[0]
+    if n_nodes < 2:
+        return 0.0
+
+    total = 0.0
+    for start in range(0, n_nodes, block_size):
+        sources = np.arange(start, min(start+block_size, n_nodes))
+        total += csgraph.shortest_path(adjacency, method='D', directed=directed, unweighted=True, indices=sources).sum()
+    return total / (n_nodes*(n_nodes-1))
+
 class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent maybe
     """
     Object for storing information regarding water-water and water-protein connections
@@ -181,6 +580,36 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         self.active_region = None
         self.graph = None
 
+        #CSR adjacency matrix of self.graph, with nodes in the order of self._node_ids
+        self.adjacency_csr = None
+        self._node_ids = None
+        self._edge_list = None
+        self._edge_status = None
+        self._edge_type = None
+
+        #Subgraphs and adjacency matrices of active site selections, cleared when the graph is rebuilt
+        self._sub_cache = {}
+
+        #Contiguous per-atom arrays (see _assemble_soa), rebuilt when atoms are added
+        self._soa_ready = False
+        self._wat_O_xyz = None
+        self._wat_H_xyz = None
+        self._wat_O_idx = None
+        self._wat_resid = None
+        self._wat_H_owner = None
+        self._prot_xyz = None
+        self._prot_idx = None
+        self._prot_resid = None
+        self._prot_name = None
+        self._prot_type = None
+        self._prot_heavy_rows = None
+        self._prot_H_rows = None
+
+        #Lookup tables used by the angle criteria in find_directed_connections
+        #(heavy atoms are stored as rows of _prot_xyz)
+        self._prot_by_index = None
+        self._prot_heavy_by_resid = None
+
     def add_atom(self, index, atom_name, residue_name, x, y, z, residue_number=None, msa_residue_number=None):
         """
         Add atom (OtherAtom object)
@@ -219,6 +648,7 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
 
             mol = OtherAtom(index, atom_name, residue_name, x, y, z, residue_number, msa_residue_number, hbonding)
             self.protein_atoms.append(mol)
+        self._soa_ready = False
 
     def add_water(self, index, o, h1, h2, residue_number):
         """
@@ -243,11 +673,116 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         ----------
         None
         """
-        o = WaterAtom(o.index, 'O', residue_number, *o.position)
-        h1 = WaterAtom(h1.index, 'H1',residue_number, *h1.position)
-        h2 = WaterAtom(h2.index, 'H2',residue_number, *h2.position)
+        self._add_water_from_arrays(index, (o.index, h1.index, h2.index), (o.position, h1.position, h2.position), residue_number)
+
+    def _add_water_from_arrays(self, index, atom_indices, positions, residue_number):
+        """
+        Add water molecule from the indices and positions of its O, H1 and H2 atoms
+
+        Parameters
+        ----------
+        index : int
+            PDB atom index
+        atom_indices : sequence
+            Atom indices of the oxygen, first hydrogen and second hydrogen
+        positions : sequence
+            Positions of the oxygen, first hydrogen and second hydrogen
+        residue_number: int
+            Residue number of water  
+
+        Returns
+        ----------
+        None
+        """
+        o = WaterAtom(atom_indices[0], 'O', residue_number, *positions[0])
+        h1 = WaterAtom(atom_indices[1], 'H1',residue_number, *positions[1])
+        h2 = WaterAtom(atom_indices[2], 'H2',residue_number, *positions[2])
         water = WaterMolecule(index, o, h1, h2, residue_number)
         self.water_molecules.append(water)
+        self._soa_ready = False
+
+    def _assemble_soa(self):
+        """
+        Collect per-atom attributes of all waters and protein atoms into contiguous arrays.
+
+        Neighbor searches and active site selection read these arrays instead of iterating 
+        over WaterMolecule and OtherAtom objects.
+
+        Returns
+        ----------
+        None
+        """
+        (self._wat_O_xyz, self._wat_H_xyz, self._wat_O_idx, 
+         self._wat_resid, self._wat_H_owner) = _stack_waters(self.water_molecules)
+        (self._prot_xyz, self._prot_idx, self._prot_resid, 
+         self._prot_name, self._prot_type) = _stack_protein(self.protein_atoms)
+
+        #Rows of H-bonding heavy atoms and hydrogens, so directed searches need no name checks
+        self._prot_heavy_rows = np.flatnonzero(self._prot_type == HBOND_HEAVY)
+        self._prot_H_rows = np.flatnonzero(self._prot_type == HBOND_HYDROGEN)
+
+        self._prot_by_index = {atm.index: atm for atm in self.protein_atoms}
+
+        heavy_by_resid = defaultdict(list)
+        for i, atm in enumerate(self.protein_atoms):
+            if atm.hbonding_type != HBOND_HYDROGEN:
+                heavy_by_resid[atm.resid].append(i)
+        self._prot_heavy_by_resid = {resid: np.array(rows, dtype=np.int64) for resid, rows in heavy_by_resid.items()}
+        self._soa_ready = True
+
+    def _get_arrays(self, water_active=None, protein_active=None, active_region_only=False):
+        """
+        Get stacked water and protein arrays for the whole network or only for the active site
+
+        Parameters
+        ----------
+        water_active : list
+            Selection of active site water molecules.
+        protein_active : list
+            Selection of active site protein molecules.
+        active_region_only : bool, optional
+            If True, stack only the active site atoms. Default is False.
+
+        Returns
+        -------
+        tuple
+            - water arrays as returned by _stack_waters
+            - protein arrays as returned by _stack_protein
+        """
+        if active_region_only:
+            return _stack_waters(water_active), _stack_protein(protein_active)
+
+        if not self._soa_ready:
+            self._assemble_soa()
+
+        return ((self._wat_O_xyz, self._wat_H_xyz, self._wat_O_idx, self._wat_resid, self._wat_H_owner),
+                (self._prot_xyz, self._prot_idx, self._prot_resid, self._prot_name, self._prot_type))
+
+    def _donor_heavy_coordinates(self, H_indices, H_coords):
+        """
+        Find the closest heavy atom in the same residue for each protein hydrogen
+
+        Parameters
+        ----------
+        H_indices : np.ndarray
+            Atom indices of protein hydrogens
+        H_coords : np.ndarray
+            (N,3) array of protein hydrogen coordinates
+
+        Returns
+        -------
+        np.ndarray
+            (N,3) array of heavy atom coordinates
+        """
+        if not self._soa_ready:
+            self._assemble_soa()
+
+        donor_coords = np.empty((len(H_indices), 3), dtype=np.float32)
+        for i, (index, coords) in enumerate(zip(H_indices, H_coords)):
+            heavy_coords = self._prot_xyz[self._prot_heavy_by_resid[self._prot_by_index[index].resid]]
+            offset = heavy_coords - coords
+            donor_coords[i] = heavy_coords[np.argmin(np.einsum('ij,ij->i', offset, offset))]
+        return donor_coords
 
     def select_active_region(self, reference, box, active_region_radius=8.0, active_region_COM=False):
         """
@@ -274,54 +809,53 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
               Active site water atoms.  
         """
 
-        #Create empty set for active site atoms
-        active_region_atoms = []
-
-
         if active_region_COM is False:
             #Find coordinates for refrence point
-            reference_positions = np.array([ref.position for ref in reference])  # Precompute reference positions
+            reference_positions = np.array([ref.position for ref in reference], dtype=np.float32).reshape(-1,3)  # Precompute reference positions
 
         else:
-            reference_positions = reference.center_of_mass()
+            reference_positions = reference.center_of_mass().astype(np.float32)
 
+        reference_resids = {r.resid for r in reference}  # Set of reference resids for fast lookup
 
-        #Find protein atoms in active site
-        protein_active = []
+        if not self._soa_ready:
+            self._assemble_soa()
 
-        reference_resids = {r.resid for r in reference}  # Set of reference resids for fast lookup
-        for atm in self.protein_atoms:
-            #Immediately include atoms which are a part of the reference
-            if atm.resid in reference_resids:
-                active_region_atoms.append(atm)
-                protein_active.append(atm)
+        #Find protein atoms in active site -- distances are only computed inside the bounding box of the reference
+        protein_mask = np.zeros(len(self.protein_atoms), dtype=bool)
+        if len(self.protein_atoms) > 0:
+            #Immediately include atoms which are a part of the reference, otherwise use distance cutoff
+            protein_mask = np.isin(self._prot_resid, list(reference_resids))
+            candidates = np.flatnonzero(_bounding_box_mask(self._prot_xyz, reference_positions, active_region_radius, box))
+            if len(candidates) > 0:
+                dist = distances.distance_array(self._prot_xyz[candidates], reference_positions, box=box).min(axis=1)
+                protein_mask[candidates] |= dist <= active_region_radius
 
-            #Include atoms within a distance cutoff
-            else:
-                dist = np.min(distances.distance_array(np.array(atm.coordinates).reshape(1, -1), reference_positions, box=box))
-                if dist <= active_region_radius:
-                    active_region_atoms.append(atm)
-                    protein_active.append(atm)
+        protein_active = [self.protein_atoms[i] for i in np.flatnonzero(protein_mask)]
 
-        #Find water molecules in active site
-        water_active = []
+        #Find water molecules in active site -- closest of O, H1, H2 to the reference
+        water_mask = np.zeros(len(self.water_molecules), dtype=bool)
+        if len(self.water_molecules) > 0:
+            water_dist = np.full(len(self.water_molecules), np.inf)
+            O_candidates = np.flatnonzero(_bounding_box_mask(self._wat_O_xyz, reference_positions, active_region_radius, box))
+            if len(O_candidates) > 0:
+                water_dist[O_candidates] = distances.distance_array(self._wat_O_xyz[O_candidates], reference_positions, box=box).min(axis=1)
 
-        for mol in self.water_molecules:
-            #Include atoms within a distance cutoff
-            water_positions = np.array([mol.O.coordinates, mol.H1.coordinates, mol.H2.coordinates])
-            
-            dist = np.min(distances.distance_array(water_positions, reference_positions))
-            if dist <= active_region_radius:            
-                active_region_atoms.append(mol)
-                water_active.append(mol)
+            H_candidates = np.flatnonzero(_bounding_box_mask(self._wat_H_xyz, reference_positions, active_region_radius, box))
+            if len(H_candidates) > 0:
+                H_dist = distances.distance_array(self._wat_H_xyz[H_candidates], reference_positions, box=box).min(axis=1)
+                np.minimum.at(water_dist, self._wat_H_owner[H_candidates], H_dist)
+
+            water_mask = water_dist <= active_region_radius
 
+        water_active = [self.water_molecules[i] for i in np.flatnonzero(water_mask)]
 
-        self.active_region = list(active_region_atoms)  # Convert set back to list if order matters
+        self.active_region = protein_active + water_active
         return self.active_region, list(protein_active), list(water_active)
 
-    def find_connections(self, dist_cutoff=3.3, water_active=None, protein_active=None, active_region_only=False, water_only=False):
+    def find_connections(self, dist_cutoff=3.3, water_active=None, protein_active=None, active_region_only=False, water_only=False, box=None):
         """
-        Find the shortest connections using a K-D Tree.
+        Find the shortest connections using MDAnalysis capped distance searches.
 
         Parameters
         ----------
@@ -335,6 +869,8 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
             If True, only find connections among active site atoms. Default is False.
         water_only : bool, optional
             If True, only find connections among waters. Default is False.
+        box : array-like, optional
+            Simulation box used for periodic boundary conditions (PBC). Default is None.
 
         Returns
         -------
@@ -356,66 +892,51 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
 
         connections = []
 
-        # Select active site atoms if specified
-        if active_region_only:
-            waters = water_active
-            protein = protein_active
-        else:
-            waters = self.water_molecules
-            protein = self.protein_atoms
-
-        # Extract water oxygen coordinates and indices
-        water_coords = np.array([mol.O.coordinates for mol in waters])
-        water_indices = np.array([mol.O.index for mol in waters])
-        water_names = np.array(['O' for _ in waters])
-        
-
-        # Water-Water connections
-        tree = cKDTree(water_coords)
-        dist, indices = tree.query(water_coords, k=10, distance_upper_bound=dist_cutoff)
-
-        for i, neighbors in enumerate(indices):
-            for j, neighbor in enumerate(neighbors):
-
-                if neighbor != i and dist[i, j] <= dist_cutoff:
-                    site_status = (
-                        'None' if self.active_region is None else
-                        'active_region' if any(waters[i].resid == f.resid for f in self.active_region) else
-                        'not_active_region'
-                    )
-                    if water_indices[i] < water_indices[neighbor]:
-                        connections.append((water_indices[i], water_indices[neighbor], water_names[i], 'WAT-WAT', site_status))
+        # Gather contiguous arrays for the selected atoms
+        water_arrays, protein_arrays = self._get_arrays(water_active, protein_active, active_region_only)
+        water_coords, _, water_indices, water_resids, _ = water_arrays
+        water_names = np.full(len(water_coords), 'O')
+
+        # Mark atoms belonging to active site residues
+        if self.active_region is not None:
+            active_resids = list({f.resid for f in self.active_region})
+            water_in_active = np.isin(water_resids, active_resids)
+
+        # Water-Water connections -- self_capped_distance returns every pair within the cutoff exactly once
+        pairs = _capped_pairs(water_coords, None, dist_cutoff, box=box)
+
+        # List the water with the lower atom index first
+        swap = water_indices[pairs[:,0]] > water_indices[pairs[:,1]]
+        pairs[swap] = pairs[swap][:, ::-1]
+        pairs = pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+        i, neighbor = pairs[:,0], pairs[:,1]
+
+        in_active = None if self.active_region is None else (water_in_active[i] | water_in_active[neighbor])
+        connections.extend(_assemble_connections(water_indices[i], water_indices[neighbor], water_names[i], 'WAT-WAT', in_active))
 
         # Water-Protein connections
         if not water_only:
-            protein_coords = np.array([atm.coordinates for atm in protein])
-            protein_indices = np.array([atm.index for atm in protein])
-            protein_names = np.array([atm.name for atm in protein])
-
-            tree = cKDTree(protein_coords)
-            dist, indices = tree.query(water_coords, k=10, distance_upper_bound=dist_cutoff)
-
-            for i, neighbors in enumerate(indices):
-                for j, neighbor in enumerate(neighbors):
-                    if dist[i, j] <= dist_cutoff:
-                        site_status = (
-                            'None' if self.active_region is None else
-                            'active_region' if any(waters[i].resid == f.resid or protein[neighbor].resid == f.resid for f in self.active_region) else
-                            'not_active_region'
-                        )
-                        if protein_names[neighbor] == 'O' or protein_names[neighbor] == 'N':
-                            classification = 'backbone'
-                        else:
-                            classification = 'side-chain'
-                        connections.append((protein_indices[neighbor], water_indices[i], protein_names[neighbor], 'WAT-PROT', site_status, classification))
+            protein_coords, protein_indices, protein_resids, protein_names, _ = protein_arrays
+
+            # capped_distance returns every water-protein pair within the cutoff
+            pairs = _capped_pairs(water_coords, protein_coords, dist_cutoff, box=box)
+            i, neighbor = pairs[:,0], pairs[:,1]
+
+            if self.active_region is None:
+                in_active = None
+            else:
+                in_active = water_in_active[i] | np.isin(protein_resids, active_resids)[neighbor]
+            backbone = np.isin(protein_names[neighbor], ['O', 'N'])
+            connections.extend(_assemble_connections(protein_indices[neighbor], water_indices[i], protein_names[neighbor], 
+                                                     'WAT-PROT', in_active, backbone=backbone))
 
         return connections
 
 
     def find_directed_connections(self, dist_cutoff=2.5, water_active=None, protein_active=None, active_region_only=False, 
-                                    water_only=False, angle_criteria=None):
+                                    water_only=False, angle_criteria=None, box=None):
         """
-        Find the shortest directed connections using a K-D Tree.
+        Find the shortest directed connections using MDAnalysis capped distance searches.
 
         Parameters
         ----------
@@ -431,6 +952,8 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
             If True, only find connections among waters. Default is False.
         angle_criteria: float, optional
             Additional angle criteria for defining hydrogen bonds. Default is None.
+        box : array-like, optional
+            Simulation box used for periodic boundary conditions (PBC). Default is None.
 
         Returns
         -------
@@ -451,283 +974,101 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         # Initialize empty list for connections
         connections = []
 
-        # Select active site atoms if specified
-        if active_region_only:
-            waters = water_active
-            protein = protein_active
-        else:
-            waters = self.water_molecules
-            protein = self.protein_atoms
+        # Gather contiguous arrays for the selected atoms
+        water_arrays, protein_arrays = self._get_arrays(water_active, protein_active, active_region_only)
+        water_O_coords, water_H_coords, water_O_indices, _, water_H_owner = water_arrays
 
-        # Gather water indices and coordinates
-        water_H_indices = []
-        water_H_coords = []
-        water_H_names = []
+        #Index lookups for the angle criteria always cover the whole network
+        if angle_criteria is not None and not self._soa_ready:
+            self._assemble_soa()
 
-        water_O_coords = []
-        water_O_indices = []
-        water_O_names = []
+        # Hydrogens are labelled with the index of their parent oxygen
+        water_H_indices = water_O_indices[water_H_owner]
+        water_H_names = np.tile(['H1', 'H2'], len(water_H_coords)//2)
 
-        for mol in waters:
+        # Mark atoms belonging to the active site
+        if self.active_region is not None:
+            active_indices = list({f.index for f in self.active_region})
+            water_in_active = np.isin(water_O_indices, active_indices)
 
-            #Select status
-            if self.active_region is None:
-                site_status = 'None'
-            elif mol in self.active_region:
-                site_status = 'active_region'
+        if water_only == False:
+            #Split protein atoms into H-bonding heavy atoms and hydrogens
+            protein_coords, protein_indices, _, protein_names, protein_types = protein_arrays
+            if active_region_only:
+                heavy = np.flatnonzero(protein_types == HBOND_HEAVY)
+                hydrogen = np.flatnonzero(protein_types == HBOND_HYDROGEN)
             else:
-                site_status = 'not_active_region'
+                heavy, hydrogen = self._prot_heavy_rows, self._prot_H_rows
 
-            # Add H1 atom
-            water_H_indices.append(mol.O.index)  #Use only O index
-            water_H_coords.append(mol.H1.coordinates)
-            water_H_names.append('H1')
+            protO_coords, protO_indices, protO_names = protein_coords[heavy], protein_indices[heavy], protein_names[heavy]
+            protH_coords, protH_indices, protH_names = protein_coords[hydrogen], protein_indices[hydrogen], protein_names[hydrogen]
 
-            # Add H2 atom
-            water_H_indices.append(mol.O.index) #Use only O index
-            water_H_coords.append(mol.H2.coordinates)
-            water_H_names.append('H2')
+            if self.active_region is not None:
+                protein_in_active = np.isin(protein_indices, active_indices)
+                protO_in_active, protH_in_active = protein_in_active[heavy], protein_in_active[hydrogen]
 
-            # Add O
-            water_O_indices.append(mol.O.index)
-            water_O_coords.append(mol.O.coordinates)
-            water_O_names.append('O')
-
-        # Convert water_coords to a numpy array
-        water_H_coords = np.array(water_H_coords).reshape(-1,3)
-        water_O_coords = np.array(water_O_coords).reshape(-1,3)
+        #Search all donors and acceptors at once over a single labelled point set
+        groups = [water_O_coords, water_H_coords]
+        if water_only == False:
+            groups.extend([protO_coords, protH_coords])
+        points = np.vstack(groups)
+        kind = np.repeat(np.arange(len(groups), dtype=np.int8), [len(f) for f in groups])
+        offsets = np.cumsum([0] + [len(f) for f in groups])
+        pairs = _capped_pairs(points, None, dist_cutoff, box=box)
 
         #Find protein-water connections
         if water_only == False:
 
-            #Gather indices and coords
-            protO_coords = []
-            protO_indices = []        
-            protO_names = []
-
-            protH_coords = []
-            protH_indices = []
-            protH_names = []
-
-            for atm in protein:
-                if 'P' in atm.name or 'O' in atm.name or 'N' in atm.name or 'S' in atm.name:
-                    protO_coords.append(atm.coordinates)
-                    protO_indices.append(atm.index)
-                    protO_names.append(atm.name)
-
-                elif 'H' in atm.name:
-                    protH_coords.append(atm.coordinates)
-                    protH_indices.append(atm.index)
-                    protH_names.append(atm.name)
-
-            protH_coords = np.array(protH_coords).reshape(-1,3)
-            protO_coords = np.array(protO_coords).reshape(-1,3)
-
             #Find distances between protein H and water O
-            #Create KDTree using protein-H coordinates
-            tree = cKDTree(protH_coords)
-
-            #Query for distances with water O coordinates
-            dist, indices = tree.query(water_O_coords, k=10, distance_upper_bound=dist_cutoff)
-
-            for index_near, index_ref in enumerate(indices):
-                for i, distance in enumerate(dist[index_near]):
-                    #Check for cutoff, scipy will output infs if distance is too high
-                    if distance <= dist_cutoff:
-                        if not active_region_only:
-                            # Determine active site status
-                            if self.active_region is None:
-                                site_status = 'None'
-                            elif any(idx in [water_H_indices[index_near], protH_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                                site_status = 'active_region'
-                            else:
-                                site_status = 'not_active_region'
-                        else: 
-                            site_status = 'active_region'
-
-                        if protH_names[index_ref[i]] == 'H' or protH_names[index_ref[i]] == 'HA': #MAKE THIS BETTER
-                            classification = 'backbone'
-                        else:
-                            classification = 'side-chain'
-                        #Append connections
-                        if angle_criteria is None:
-                            connections.append([protH_indices[index_ref[i]], water_O_indices[index_near], protH_names[index_ref[i]] , 'WAT-PROT', site_status, classification])
-                        else:
-                            protein_hydrogen_coords = protH_coords[index_ref[i]]
-                            water_oxygen_coords = water_O_coords[index_near]
-
-                            protein_resid = [atm.resid for atm in self.protein_atoms if atm.index == protH_indices[index_ref[i]]][0]
-
-                            protein_O_coordinates = [atm.coordinates for atm in self.protein_atoms if (atm.resid == protein_resid and 'H' not in atm.name)]
-                            distances = [np.linalg.norm(protein_hydrogen_coords-f) for f in protein_O_coordinates]
-                            arg = np.argmin(distances)
-
-                            prot_heavy_coordinates = protein_O_coordinates[arg]
-
-                            prot_water = water_oxygen_coords - protein_hydrogen_coords
-                            prot_prot = prot_heavy_coordinates - protein_hydrogen_coords
-
-                            prot_water = prot_water.flatten()
-                            prot_prot = prot_prot.flatten()
-
-                            cosine_angle = np.dot(prot_water, prot_prot) / (np.linalg.norm(prot_water) * np.linalg.norm(prot_prot))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            if angle1 >= angle_criteria:
-                                connections.append([protH_indices[index_ref[i]], water_O_indices[index_near], protH_names[index_ref[i]] , 'WAT-PROT', site_status, classification])
-
-            #Find distances between protein O,S,P,N and water H
-
-            #Create KDTree using protein OSPN coordinates
-            tree = cKDTree(protO_coords)
-
-            #Query for distances with water-H coords
-            dist, indices = tree.query(water_H_coords, k=10, distance_upper_bound=dist_cutoff)
-            for index_near, index_ref in enumerate(indices):
-                for i, distance in enumerate(dist[index_near]):
-                    if distance <= dist_cutoff:        
-                        if not active_region_only:
-                            # Determine active site status
-                            if self.active_region is None:
-                                site_status = 'None'
-                            elif any(idx in [water_H_indices[index_near], protO_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                                site_status = 'active_region'
-                            else:
-                                site_status = 'not_active_region'
-                        else: 
-                            site_status = 'active_region'
-
-                        if protO_names[index_ref[i]] == 'O' or protO_names[index_ref[i]] == 'N':
-                            classification = 'backbone'
-                        else:
-                            classification = 'side-chain'
-                        #Append connections
-                        if angle_criteria is None:
-                            connections.append([water_H_indices[index_near], protO_indices[index_ref[i]], water_H_names[index_near], 'WAT-PROT', site_status,classification])
-                        else:
-                            protein_heavy_coords = protO_coords[index_ref[i]]
-                            water_hydrogen_coords = water_H_coords[index_near]
-                            water_o_coords = [water.O.coordinates for water in self.water_molecules if (water.O.index == water_H_indices[index_near])]
-
-                            prot_water = protein_heavy_coords - water_o_coords
-                            water1 = water_o_coords - water_hydrogen_coords
-
-                            prot_water = prot_water.flatten()
-                            water1 = water1.flatten()
-
-                            cosine_angle = np.dot(prot_water, water1) / (np.linalg.norm(prot_water) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            if angle1 >= angle_criteria:
-                                connections.append([water_H_indices[index_near], protO_indices[index_ref[i]], water_H_names[index_near], 'WAT-PROT', site_status, classification])
-
-
-            
-        #Find distances between water O and water H
-
-        #Create KDTree for water-O coords
-        tree = cKDTree(water_O_coords)
+            water_pos, protH_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_O, POINT_PROTEIN_H)
 
-        #Query for distances with water-H coords
-        dist, indices = tree.query(water_H_coords, k=10, distance_upper_bound=dist_cutoff)
+            #Apply angle criteria to all pairs at once, measuring the angle at the protein hydrogen
+            if angle_criteria is not None and len(water_pos) > 0:
+                H_unique, H_inverse = np.unique(protH_pos, return_inverse=True)
+                donor_coords = self._donor_heavy_coordinates(protH_indices[H_unique], protH_coords[H_unique])[H_inverse]
 
-        
-        for index_near, index_ref in enumerate(indices):
-            for i, distance in enumerate(dist[index_near]):
+                H_water = water_O_coords[water_pos] - protH_coords[protH_pos]
+                H_donor = donor_coords - protH_coords[protH_pos]
+                keep = np.where(_bond_angles(H_water, H_donor, box=box) >= angle_criteria)[0]
+                water_pos, protH_pos = water_pos[keep], protH_pos[keep]
 
-                if distance <= dist_cutoff:
-                    if not active_region_only:
-                        # Determine active site status
-                        if self.active_region is None:
-                            site_status = 'None'
-                        elif any(idx in [water_H_indices[index_near], water_O_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                            site_status = 'active_region'
-                        else:
-                            site_status = 'not_active_region'
-                    else: 
-                        site_status = 'active_region'
+            in_active = None if self.active_region is None else (water_in_active[water_pos] | protH_in_active[protH_pos])
+            connections.extend(_assemble_connections(protH_indices[protH_pos], water_O_indices[water_pos], protH_names[protH_pos], 
+                                                     'WAT-PROT', in_active, active_region_only, backbone=np.isin(protH_names[protH_pos], ['H', 'HA'])))
 
+            #Find distances between protein O,S,P,N and water H
+            H_pos, protO_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_H, POINT_PROTEIN_HEAVY)
 
-                    if water_H_indices[index_near] != water_O_indices[index_ref[i]]: #Check to make sure connection is not within the same water
-                        
-                        #Append connections
-                        if angle_criteria is None:
-
-                            if water_H_indices[index_near]<water_O_indices[index_ref[i]]:
-                                #print('IMPORTANT: CHECKING DUPLICATE CONNECTIONS')
-                                connections.append([water_H_indices[index_near],water_O_indices[index_ref[i]], water_H_names[index_near], 'WAT-WAT', site_status])
-
-                        else:
-                            water_hydrogen_coords = water_H_coords[index_near]
-                            water_o1_coords = water_O_coords[index_ref[i]]
-                            
-                            water_o2_coords = [water.O.coordinates for water in self.water_molecules if (water.O.index == water_H_indices[index_near])][0]
-                            water1 = water_hydrogen_coords - water_o1_coords
-                            water2 = water_hydrogen_coords - water_o2_coords
+            #Apply angle criteria to all pairs at once, comparing water O->acceptor with water H->O
+            if angle_criteria is not None and len(H_pos) > 0:
+                donor_coords = water_O_coords[water_H_owner[H_pos]]
 
-                            water1 = water1.flatten()
-                            water2 = water2.flatten()
+                O_acceptor = protO_coords[protO_pos] - donor_coords
+                H_O = donor_coords - water_H_coords[H_pos]
+                keep = np.where(_bond_angles(O_acceptor, H_O, box=box) >= angle_criteria)[0]
+                H_pos, protO_pos = H_pos[keep], protO_pos[keep]
 
-                            cosine_angle = np.dot(water1, water2) / (np.linalg.norm(water2) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
+            in_active = None if self.active_region is None else (water_in_active[water_H_owner[H_pos]] | protO_in_active[protO_pos])
+            connections.extend(_assemble_connections(water_H_indices[H_pos], protO_indices[protO_pos], water_H_names[H_pos], 
+                                                     'WAT-PROT', in_active, active_region_only, backbone=np.isin(protO_names[protO_pos], ['O', 'N'])))
 
-                            if angle1 >= angle_criteria and water_H_indices[index_near]<water_O_indices[index_ref[i]]:
-                                connections.append([water_H_indices[index_near],water_O_indices[index_ref[i]], water_H_names[index_near], 'WAT-WAT', site_status])
+        #Find distances between water H and water O
+        H_pos, O_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_H, POINT_WATER_O)
 
+        #Check to make sure connection is not within the same water
+        keep = water_H_indices[H_pos] != water_O_indices[O_pos]
+        H_pos, O_pos = H_pos[keep], O_pos[keep]
 
-        #Find distances between water H and water O
+        #Apply angle criteria to all pairs at once, measuring the angle at the donor hydrogen
+        if angle_criteria is not None and len(H_pos) > 0:
+            H_acceptor = water_H_coords[H_pos] - water_O_coords[O_pos]
+            H_donor = water_H_coords[H_pos] - water_O_coords[water_H_owner[H_pos]]
+            keep = np.where(_bond_angles(H_acceptor, H_donor, box=box) >= angle_criteria)[0]
+            H_pos, O_pos = H_pos[keep], O_pos[keep]
 
-        #Create KDTree for water-O coords
-        tree = cKDTree(water_H_coords)
-
-        #Query for distances with water-H coords
-        dist, indices = tree.query(water_O_coords, k=10, distance_upper_bound=dist_cutoff)
-
-        
-        for index_near, index_ref in enumerate(indices):
-            for i, distance in enumerate(dist[index_near]):
-
-                if distance <= dist_cutoff:
-                    if not active_region_only:
-                        # Determine active site status
-                        if self.active_region is None:
-                            site_status = 'None'
-                        elif any(idx in [water_O_indices[index_near], water_H_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                            site_status = 'active_region'
-                        else:
-                            site_status = 'not_active_region'
-                    else: 
-                        site_status = 'active_region'
-
-                    if water_O_indices[index_near] != water_H_indices[index_ref[i]]: #Check to make sure connection is not within the same water
-                        
-                        #Append connections
-                        if angle_criteria is None:
-
-                            if water_O_indices[index_near]<water_H_indices[index_ref[i]]:
-                                #print('IMPORTANT: CHECKING DUPLICATE CONNECTIONS')
-                                if [water_H_indices[index_ref[i]], water_O_indices[index_near], water_H_names[index_ref[i]], 'WAT-WAT', site_status] not in connections:
-                                    connections.append([water_H_indices[index_ref[i]], water_O_indices[index_near], water_H_names[index_ref[i]], 'WAT-WAT', site_status])
-
-                        else:
-                            water_hydrogen_coords = water_H_coords[index_ref[i]]
-                            water_o1_coords = water_O_coords[index_near]
-                            
-                            water_o2_coords = [water.O.coordinates for water in self.water_molecules if (water.O.index == water_H_indices[index_ref[i]])][0]
-                            water1 = water_hydrogen_coords - water_o1_coords
-                            water2 = water_hydrogen_coords - water_o2_coords
-
-                            water1 = water1.flatten()
-                            water2 = water2.flatten()
-
-                            cosine_angle = np.dot(water1, water2) / (np.linalg.norm(water2) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            #if angle1 >= angle_criteria and water_H_indices[index_ref[i]]<water_O_indices[index_near]:
-                            if angle1 >= angle_criteria and [water_H_indices[index_ref[i]], water_O_indices[index_near], water_H_names[index_ref[i]], 'WAT-WAT', site_status] not in connections and [water_O_indices[index_near], water_H_names[index_ref[i]], 'WAT-WAT', site_status] not in connections:
-                                connections.append([water_H_indices[index_ref[i]], water_O_indices[index_near], water_H_names[index_ref[i]], 'WAT-WAT', site_status])
-
-                
+        in_active = None if self.active_region is None else (water_in_active[water_H_owner[H_pos]] | water_in_active[O_pos])
+        connections.extend(_assemble_connections(water_H_indices[H_pos], water_O_indices[O_pos], water_H_names[H_pos], 
+                                                 'WAT-WAT', in_active, active_region_only))
 
         return connections
 
@@ -778,36 +1119,29 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
 
         #Only include atoms in active site -- greatly increases performance
         if active_region_only:
-            for molecule in water_active:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in water_active) #have nodes on all oxygens
 
             if water_only == False:
-                for molecule in protein_active:   
-                    MSA_index = MSA_indices[molecule.resid-1]           
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in protein_active)
 
-            self.connections = self.find_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only)
-            for connection in [f for f in self.connections if f[4]=='active_region']:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            self.connections = self.find_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only, box=box)
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections if connection[4]=='active_region')
 
         #Include all atoms
         else:
-            for molecule in self.water_molecules:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in self.water_molecules) #have nodes on all oxygens
 
             if water_only == False:
                 #for molecule in self.protein_subset:
-                for molecule in self.protein_atoms:
-                    MSA_index = MSA_indices[molecule.resid-1]  
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=None)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': None}) for molecule in self.protein_atoms)
             
-            self.connections = self.find_connections(dist_cutoff=max_connection_distance, water_active=None, protein_active=None, active_region_only=False, water_only=water_only)
+            self.connections = self.find_connections(dist_cutoff=max_connection_distance, water_active=None, protein_active=None, active_region_only=False, water_only=water_only, box=box)
 
-            for connection in self.connections:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections)
 
         #Save as self.graph
         self.graph = G
+        self._build_adjacency(active_region_only)
 
         return self.graph
 
@@ -857,37 +1191,121 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         #Only active site atoms in networks
         if active_region_only==True:
             #Add nodes
-            for molecule in water_active:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in water_active) #have nodes on all oxygens
 
             if water_only == False:
-                for molecule in protein_active:              
-                    MSA_index = MSA_indices[molecule.resid-1]
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in protein_active)
 
             #Add edges
-            self.connections = self.find_directed_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only, angle_criteria=angle_criteria)
-            for connection in [f for f in self.connections if f[4]=='active_region']:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            self.connections = self.find_directed_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only, angle_criteria=angle_criteria, box=box)
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections if connection[4]=='active_region')
 
         #All atoms in network
         else:
             #Add nodes
-            for molecule in self.water_molecules:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in self.water_molecules) #have nodes on all oxygens
 
             if water_only == False:
                 #for molecule in self.protein_subset:
-                for molecule in self.protein_atoms:
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in self.protein_atoms)
             
             #Add edges
-            self.connections = self.find_directed_connections(dist_cutoff=max_connection_distance, water_active=None, protein_active=None, active_region_only=False, water_only=water_only)
-            for connection in self.connections:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            self.connections = self.find_directed_connections(dist_cutoff=max_connection_distance, water_active=None, protein_active=None, active_region_only=False, water_only=water_only, box=box)
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections)
+
+        self.graph = G
+        self._build_adjacency(active_region_only)
+        return G
+
+    def _build_adjacency(self, active_region_only=False):
+        """
+        Store the edges of self.graph as a CSR adjacency matrix (self.adjacency_csr)
+
+        Parameters
+        ----------
+        active_region_only : bool, optional
+            If True, only connections within the active site are edges of the graph. Default is False.
+
+        Returns
+        ----------
+        None
+        """
+        if active_region_only:
+            connections = [f for f in self.connections if f[4]=='active_region']
+        else:
+            connections = self.connections
+
+        #Nodes are numbered in the order they appear in self.graph
+        self._node_ids = np.fromiter(self.graph.nodes, dtype=np.int64, count=self.graph.number_of_nodes())
+        node_order = np.argsort(self._node_ids)
+
+        edges = np.array([(f[0], f[1]) for f in connections], dtype=np.int64).reshape(-1,2)
+
+        #Repeated connections are one graph edge, holding the attributes of the last connection added
+        edge_keys = edges if self.graph.is_directed() else np.sort(edges, axis=1)
+        _, last = np.unique(edge_keys[::-1], axis=0, return_index=True)
+        keep = np.sort(len(edges) - 1 - last)
+
+        #Edge attributes as arrays parallel to the edge list, so selections are boolean masks
+        self._edge_list = node_order[np.searchsorted(self._node_ids, edges[keep], sorter=node_order)]
+        self._edge_status = np.array([f[4] for f in connections], dtype=str)[keep]
+        self._edge_type = np.array([f[3] for f in connections], dtype=str)[keep]
+        self.adjacency_csr = _edge_adjacency(self._edge_list, len(self._node_ids))
+        self._sub_cache.clear()
+
+    def _get_subgraph(self, selection='all'):
+        """
+        Get the whole graph or the subgraph of edges with a given active site status
+
+        Parameters
+        ----------
+        selection : {'all', 'active_region', 'not_active_region'}
+            Specifies which subset of the graph to analyze.
+
+        Returns
+        -------
+        networkx.Graph or networkx.DiGraph
+            Selected graph
+        """
+        if selection == 'all':
+            return self.graph
+
+        #Graphs assigned directly to self.graph have no edge arrays yet
+        if self.adjacency_csr is None:
+            self._build_adjacency()
+
+        if ('graph', selection) not in self._sub_cache:
+            #Select edges with a mask over the stored edge statuses
+            edges = self._node_ids[self._edge_list[self._edge_status == selection]]
+            self._sub_cache[('graph', selection)] = self.graph.edge_subgraph(list(zip(edges[:,0].tolist(), edges[:,1].tolist())))
+        return self._sub_cache[('graph', selection)]
+
+    def _selected_adjacency(self, selection='all'):
+        """
+        Get the adjacency matrix of the whole graph or of the edges with a given active site status
+
+        Parameters
+        ----------
+        selection : {'all', 'active_region', 'not_active_region'}
+            Specifies which subset of the graph to analyze.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Adjacency matrix. For a subset, only nodes touched by the selected edges are kept.
+        """
+        #Graphs assigned directly to self.graph have no adjacency matrix yet
+        if self.adjacency_csr is None:
+            self._build_adjacency()
+
+        if selection == 'all':
+            return self.adjacency_csr
 
-        self.graph = G
-        return G
+        if ('adjacency', selection) not in self._sub_cache:
+            edges = self._edge_list[self._edge_status == selection]
+            nodes, inverse = np.unique(edges, return_inverse=True)
+            self._sub_cache[('adjacency', selection)] = _edge_adjacency(inverse.reshape(-1,2), len(nodes))
+        return self._sub_cache[('adjacency', selection)]
 
     def get_density(self, selection='all'):
         """
@@ -911,10 +1329,7 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
             The density of the selected network.
         """   
         #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in S.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
 
         #Calculate density for subgraph
         nedges = S.number_of_edges()
@@ -927,8 +1342,7 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         """
         Compute the connected components of the graph.
 
-        Requires `self.graph` to exist. Uses `weakly_connected_components` if the graph is directed, 
-        and `connected_components` if the graph is undirected.
+        Requires `self.adjacency_csr` to exist. Uses weak connectivity if the graph is directed.
 
         Parameters
         ----------
@@ -940,26 +1354,13 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         numpy.ndarray
             An array of connected components in the selected network.
         """
-        #Initiate empty array for connected components
-        components = []
-
-        #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        adjacency = self._selected_adjacency(selection)
 
-        #Use weakly_connected_components for directed graph
-        if self.graph.is_directed():
-            for val in [len(cc) for cc in nx.weakly_connected_components(S)]:
-                components.append(val)
-        #Use connected_components for undirected
-        else:
-            for val in [len(cc) for cc in nx.connected_components(S)]:
-                components.append(val)
+        #Weakly connected components for directed graphs, connected components for undirected
+        n_components, labels = csgraph.connected_components(adjacency, directed=self.graph.is_directed(), connection='weak')
 
         #Reshape components to make plotting easier
-        components = np.array(components).reshape(-1,1)
+        components = np.bincount(labels, minlength=n_components).reshape(-1,1)
         return components
     
     def get_interactions(self, selection='all'):
@@ -1017,40 +1418,37 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         float
             The characteristic path length of the selected network.
         """
-        #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        adjacency = self._selected_adjacency(selection)
+        directed = self.graph.is_directed()
 
-        try:
-            CPL = nx.average_shortest_path_length(S)
-        except nx.NetworkXError: #average_shortest_path_length will fail if graph is not connected
-            if S.is_directed():
-
-                #Change to undirected graph for nx.average_shortest_path_length
-                S = S.to_undirected() 
+        #Average over the whole graph only if every node can reach every other node
+        n_components, labels = csgraph.connected_components(adjacency, directed=directed, connection='strong')
+        if n_components == 1:
+            CPL = _average_path_length(adjacency, directed=directed)
+        else:
+            #Otherwise average over the connected components of the undirected graph
+            n_components, labels = csgraph.connected_components(adjacency, directed=False)
+            sizes = np.bincount(labels, minlength=n_components)
+            members = np.split(np.argsort(labels, kind='stable'), np.cumsum(sizes)[:-1])
 
             if exclude_single_points:
-                cc = [f for f in nx.connected_components(S) if len(f)>1]
+                cc = np.flatnonzero(sizes > 1)
             else:
-                cc = [f for f in nx.connected_components(S)]
+                cc = np.arange(n_components)
 
-            CPLs = []
             if calculate_path == 'all':
-                for C in (S.subgraph(c).copy() for c in cc):
-                    CPLs.append(nx.average_shortest_path_length(C))
+                CPLs = [_average_path_length(adjacency[members[c]][:, members[c]]) for c in cc]
 
                 #Average over all calculated CPLs
                 CPL = np.array(CPLs).mean()
             
             else:
-                largest_cc = max(nx.connected_components(S), key=len)
-                CPL = nx.average_shortest_path_length(largest_cc)
+                largest_cc = members[np.argmax(sizes)]
+                CPL = _average_path_length(adjacency[largest_cc][:, largest_cc])
 
         return CPL
 
-    def get_shortest_path(self, selection='all', source=None, target=None):
+    def get_shortest_path(self, selection='all', source=None, target=None, backend=None):
         """
         Calculate the shortest path for a given network
 
@@ -1062,6 +1460,8 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
             Source node to initialize path
         target : int, optional
             Target node to terminate path
+        backend : str, optional
+            NetworkX dispatch backend to run on (e.g. 'cugraph' or 'parallel'), if installed. Default is None.
 
         Returns
         -------
@@ -1073,15 +1473,14 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         ----
         Node indexes are equivalent to MDAnalysis 0-based atom indexing (Add 1 to your pdb atom numbering!)
         """
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
 
-        shortest_path = nx.shortest_path(S, source, target)
+        #Only pass a backend when one is requested, so older NetworkX versions are unaffected
+        kwargs = {} if backend is None else {'backend': backend}
+        shortest_path = nx.shortest_path(S, source, target, **kwargs)
         return shortest_path
     
-    def get_clustering_coefficient(self, selection='all'):
+    def get_clustering_coefficient(self, selection='all', backend=None):
         """
         Calculate the clustering coefficient for each node
 
@@ -1089,6 +1488,8 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         ----------
         selection : {'all', 'active_region', 'not_active_region'}
             Specifies which subset of the graph to analyze.
+        backend : str, optional
+            NetworkX dispatch backend to run on (e.g. 'cugraph' or 'parallel'), if installed. Default is None.
 
         Returns
         -------
@@ -1096,12 +1497,20 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
             Clustering coefficient at each node position      
         """
         #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
+
+        #Selections without nodes (e.g. no waters in the active region) have no coefficients
+        if S.number_of_nodes() == 0:
+            return {}
 
-        CC_dict = nx.clustering(S)
+        #Directed graphs and dispatch backends go through networkx
+        if S.is_directed() or backend is not None:
+            kwargs = {} if backend is None else {'backend': backend}
+            return nx.clustering(S, **kwargs)
+
+        nodes = list(S)
+        CC = _clustering_coefficients(nx.to_scipy_sparse_array(S, nodelist=nodes, weight=None, format='csr'))
+        CC_dict = dict(zip(nodes, CC.tolist()))
         return CC_dict
 
     def get_entropy(self, selection='all'):
@@ -1121,33 +1530,15 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         float
             The computed graph entropy.
         """
-        def degree_distribuiton(G):
-            vk = dict(G.degree())
-            vk = list(vk.values())
-
-            maxk = np.max(vk)
-            mink = np.min(vk)
-
-            kvalues = np.arange(0, maxk+1)
-
-            Pk = np.zeros(maxk+1)
-            for k in vk:
-                Pk[k] = Pk[k] + 1
+        S = self._get_subgraph(selection)
 
-            Pk = Pk/sum(Pk)
-            return kvalues, Pk
-        
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        #Degree distribution of the selected graph
+        vk = np.fromiter((d for _, d in S.degree()), dtype=np.int64, count=S.number_of_nodes())
+        counts = np.bincount(vk)
+        Pk = counts/counts.sum()
 
-        k, Pk = degree_distribuiton(S)
-
-        H = 0
-        for p in Pk:
-            if p > 0:
-                H = H - p*np.log2(p)
+        Pk = Pk[Pk > 0]
+        H = float(-(Pk*np.log2(Pk)).sum())
 
         return H
     
@@ -1166,27 +1557,31 @@ class WaterNetwork:  #For water-protein analysis -- extrapolate to other solvent
         Returns
         -------
         numpy.ndarray
-            An array of coordinates for the selected atoms.
+            (N,3) float32 array of coordinates for the selected atoms.
         """
+        if not self._soa_ready:
+            self._assemble_soa()
+
         #Choose all subgraphs under particular criteria
         if selection=='all':
-            #Find all coordinates -- only water oxygens
-            coords = [np.array(f.O.coordinates) for f in self.water_molecules]
-
+            water_rows = slice(None)
+            protein_rows = slice(None)
             if not water_only:
                 print('Including OtherAtoms in clustering')
-                #coords.extend([np.array(f.coordinates) for f in self.protein_subset])
-                coords.extend([np.array(f.coordinates) for f in self.protein_atoms])
 
         else:
-            #Find all coordinates -- only water oxygens
-            coords = [np.array(f.O.coordinates) for f in self.active_region if type(f)==WaterMolecule]
+            #Rows of the active site atoms in the stacked arrays
+            active_indices = [f.O.index if type(f)==WaterMolecule else f.index for f in self.active_region]
+            water_rows = np.isin(self._wat_O_idx, active_indices)
+            protein_rows = np.isin(self._prot_idx, active_indices)
 
-            if not water_only:
-                coords.extend([np.array(f.coordinates) for f in self.active_region if type(f)==OtherAtom])
+        #Find all coordinates -- only water oxygens
+        coords = [self._wat_O_xyz[water_rows]]
 
+        if not water_only:
+            coords.append(self._prot_xyz[protein_rows])
 
-        return coords
+        return np.concatenate(coords)
 
 
 def get_clusters(coordinates, cluster, min_samples=10, eps=0.0, n_jobs=1, filename_base='DYNAMIC_CLUSTER'):
@@ -1271,52 +1666,115 @@ def collect_densities(topology_file, trajectory_file, active_region_definition,
     hotspot_coords = find_clusters_from_densities(f"{output_name}.dx", output_name=f"{output_name}_densityclusters", threshold=1.5)
     return hotspot_coords
 
-def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type, custom_selection, 
-                              active_region_reference, active_region_COM, active_region_radius, water_name, msa_indexing, 
-                              active_region_only=False, directed=False, angle_criteria=None, max_connection_distance=3.0):
+#Universes opened in this process, kept so that joblib workers open each trajectory once
+#(keyed by file modification times so that rewritten files are reopened, and limited to the most recently opened)
+_UNIVERSE_CACHE = {}
+_MAX_CACHED_UNIVERSES = 2
+
+#Atom groups selected on cached universes, keyed by files and selection options
+_SELECTION_CACHE = {}
+
+def _file_stamp(path):
     """
-    Extract and compute a water network for each frame.
+    Get the modification time and size of a file
 
-    This function initializes a network based on the provided parameters and returns a 
-    `WaterNetwork` object representing the computed network.
+    Parameters
+    ----------
+    path : str
+        Path to the file
+
+    Returns
+    -------
+    tuple or None
+        Modification time (ns) and size, or None if the file cannot be read
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _release_universe(key):
+    """
+    Close a cached Universe and forget the atom groups selected on it
+
+    Parameters
+    ----------
+    key : tuple
+        Key of the Universe in _UNIVERSE_CACHE
+
+    Returns
+    -------
+    None
+    """
+    u = _UNIVERSE_CACHE.pop(key)
+    for selection_key in [k for k, v in _SELECTION_CACHE.items() if v[0] is u]:
+        del _SELECTION_CACHE[selection_key]
+    u.trajectory.close()
+
+def clear_trajectory_caches():
+    """
+    Close all Universes cached in this process and forget their atom groups
+
+    Returns
+    -------
+    None
+    """
+    for key in list(_UNIVERSE_CACHE):
+        _release_universe(key)
+    _SELECTION_CACHE.clear()
+
+def _get_universe(pdb_file, trajectory_file):
+    """
+    Open a topology and trajectory as an MDAnalysis Universe once per process
 
     Parameters
     ----------
     pdb_file : str
         Path to the topology file.
-    trajectory_file: str
+    trajectory_file : str
         Path to the trajectory file
-    frame_idx: int
-        Index of given frame
-    network_type : {'water-water', 'water-protein'}
-        Type of network to construct.
+
+    Returns
+    -------
+    MDAnalysis.Universe
+        Universe shared by every frame processed in this process
+    """
+    key = (pdb_file, trajectory_file, _file_stamp(pdb_file), _file_stamp(trajectory_file))
+    if key not in _UNIVERSE_CACHE:
+        #Drop older versions of these files and the least recently opened universes
+        for old_key in [k for k in _UNIVERSE_CACHE if k[:2] == key[:2]]:
+            _release_universe(old_key)
+        while len(_UNIVERSE_CACHE) >= _MAX_CACHED_UNIVERSES:
+            _release_universe(next(iter(_UNIVERSE_CACHE)))
+        _UNIVERSE_CACHE[key] = mda.Universe(pdb_file, trajectory_file)
+    return _UNIVERSE_CACHE[key]
+
+def _select_network_atoms(u, custom_selection, water_name, directed):
+    """
+    Select the protein, water and H-bonding protein atom groups used to build networks from a Universe
+
+    Selections, bond guessing and the protein radius use the current frame of the Universe.
+
+    Parameters
+    ----------
+    u : MDAnalysis.Universe
+        Universe containing the system
     custom_selection : str or None
         MDAnalysis selection string for custom residue selections.
-    active_region_reference : str or None
-        MDAnalysis selection string defining the reference for the active site.
-    active_region_COM : bool, optional  
-        Whether to take center of mass of active site references, or combine for sphere selection
-    active_region_radius : float
-        Radius (in Å) to define the active site region.
     water_name : str
         Name of water molecules in the system.
-    msa_indexing : bool
-        Whether to use MSA (multiple sequence alignment) indexing.
-    active_region_only : bool, optional
-        If True, only includes active site atoms in the network. Default is False.
-    directed : bool, optional
-        If True, constructs a directed network. Default is False.
-    angle_criteria : float or None, optional
-        Angle cutoff criteria for hydrogen-bonding structures. Default is None.
-    max_connection_distance : float, optional
-        Maximum distance (in Å) for defining connections in the network. Default is 3.0.
+    directed : bool
+        If True, include protein hydrogens bonded to H-bonding heavy atoms.
 
     Returns
     -------
-    WaterNetwork
-        A `WaterNetwork` object representing the computed network for the given PDB.
+    tuple
+        - protein AtomGroup, or None if there is no protein
+        - AtomGroup of all waters
+        - AtomGroup of H-bonding protein atoms, or None if there is no protein
+        - maximum distance between the protein center of mass and a protein atom, or None if there is no protein
     """
- 
     #Allow for custom residues in protein selection
     if custom_selection is None:
         custom_sel = ''
@@ -1329,51 +1787,167 @@ def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type
     else:
         water = f"resname {water_name}"
 
-    #Create mda Universe
-    u = mda.Universe(pdb_file, trajectory_file) 
-
     try:
-        #Find maximum distance between edge of protein and middle of protein
         protein = u.select_atoms("protein")
-        protein_com = protein.center_of_mass()
-        distances_to_com = np.linalg.norm(protein.atoms.positions - protein_com, axis=1)
-        max_distance = np.max(distances_to_com)
+        if len(protein) == 0:
+            raise ValueError('No protein atoms')
 
-        #Separate key atom groups
-        ag_wat = u.select_atoms(f'{water} and (sphzone {max_distance+0.5} protein)', updating=True)
+        #Separate key atom groups -- waters near the protein are picked per frame
+        ag_wat_all = u.select_atoms(water)
         if not directed:
-            ag_protein = u.select_atoms(f'(protein {custom_sel}) and (name N* or name O* or name P* or name S*)', updating=True)
+            ag_protein = u.select_atoms(f'(protein {custom_sel}) and (name N* or name O* or name P* or name S*)')
         else:
             # Restrict hydrogens to those near polar atoms to minimize guess_bonds() overhead
             polar_heavy = u.select_atoms(f'(protein {custom_sel}) and (name N* or name O* or name P* or name S*)')
             hydrogens = u.select_atoms(f'protein {custom_sel} and name H*')
 
             # Find hydrogens near these heavy atoms (within 1.2 Å, a typical H-bond distance)
-            from MDAnalysis.analysis.distances import distance_array
-
-            dists = distance_array(hydrogens.positions, polar_heavy.positions)
-            close_hydrogens = hydrogens[dists.min(axis=1) < 1.2]  # Select only close hydrogens
+            pairs = _capped_pairs(hydrogens.positions, polar_heavy.positions, 1.2, box=u.dimensions)
+            close_hydrogens = hydrogens[np.unique(pairs[:,0])]  # Select only close hydrogens
 
             # Step 4: Combine hydrogens and polar atoms into one AtomGroup
             relevant_atoms = close_hydrogens + polar_heavy
             relevant_atoms.guess_bonds()  # Guess bonds only for relevant hydrogens
 
 
-            ag_protein = u.select_atoms(f"(protein {custom_sel}) and ((name H* and bonded (name N* or name O* or name P* or name S*)) or name N* or name O* or name P* or name S*)", updating=True)
-
-        ag_misc = u.select_atoms(f'not (protein or {water})', updating=True) #Keeping this for non-biological systems or where other solvent is important
+            ag_protein = u.select_atoms(f"(protein {custom_sel}) and ((name H* and bonded (name N* or name O* or name P* or name S*)) or name N* or name O* or name P* or name S*)")
 
     except:
         #Make water only
         print('No protein found, creating a network of only waters')
-        ag_wat = u.select_atoms(f"resname HOH or resname WAT or resname SOL")
+        protein, ag_protein = None, None
+        ag_wat_all = u.select_atoms(f"resname HOH or resname WAT or resname SOL")
+
+    #Find maximum distance between edge of protein and middle of protein
+    max_distance = None
+    if protein is not None:
+        max_distance = float(np.linalg.norm(protein.positions - protein.center_of_mass(), axis=1).max())
+
+    return protein, ag_wat_all, ag_protein, max_distance
+
+def _get_frame_selections(pdb_file, trajectory_file, custom_selection, water_name, directed):
+    """
+    Select the protein, water and H-bonding protein atom groups of a cached Universe once per process
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the topology file.
+    trajectory_file : str
+        Path to the trajectory file
+    custom_selection : str or None
+        MDAnalysis selection string for custom residue selections.
+    water_name : str
+        Name of water molecules in the system.
+    directed : bool
+        If True, include protein hydrogens bonded to H-bonding heavy atoms.
+
+    Returns
+    -------
+    tuple
+        - MDAnalysis.Universe
+        - atom groups and protein radius as returned by _select_network_atoms, measured on the first frame
+    """
+    u = _get_universe(pdb_file, trajectory_file)
+
+    #Selections made on an older Universe of the same files are stale
+    key = (pdb_file, trajectory_file, custom_selection, water_name, directed)
+    if key in _SELECTION_CACHE and _SELECTION_CACHE[key][0] is u:
+        return _SELECTION_CACHE[key]
+
+    #Selections and bond guessing use the first frame
+    u.trajectory[0]
+
+    _SELECTION_CACHE[key] = (u, *_select_network_atoms(u, custom_selection, water_name, directed))
+    return _SELECTION_CACHE[key]
+
+def _sphere_rows(center, positions, radius, box=None):
+    """
+    Find positions within a sphere, accounting for periodic boundary conditions
+
+    Parameters
+    ----------
+    center : np.ndarray
+        Center of the sphere
+    positions : np.ndarray
+        (N,3) array of coordinates
+    radius : float
+        Radius of the sphere
+    box : array-like, optional
+        Simulation box dimensions. Default is None.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted rows of positions within radius of center
+    """
+    pairs = _capped_pairs(np.asarray(center, dtype=np.float32).reshape(1,3), positions, radius, box=box)
+    return np.unique(pairs[:,1])
+
+def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type, custom_selection, 
+                              active_region_reference, active_region_COM, active_region_radius, water_name, msa_indexing, 
+                              active_region_only=False, directed=False, angle_criteria=None, max_connection_distance=3.0):
+    """
+    Extract and compute a water network for each frame.
+
+    This function initializes a network based on the provided parameters and returns a 
+    `WaterNetwork` object representing the computed network.
+
+    Parameters
+    ----------
+    pdb_file : str
+        Path to the topology file.
+    trajectory_file: str
+        Path to the trajectory file
+    frame_idx: int
+        Index of given frame
+    network_type : {'water-water', 'water-protein'}
+        Type of network to construct.
+    custom_selection : str or None
+        MDAnalysis selection string for custom residue selections.
+    active_region_reference : str or None
+        MDAnalysis selection string defining the reference for the active site.
+    active_region_COM : bool, optional  
+        Whether to take center of mass of active site references, or combine for sphere selection
+    active_region_radius : float
+        Radius (in Å) to define the active site region.
+    water_name : str
+        Name of water molecules in the system.
+    msa_indexing : bool
+        Whether to use MSA (multiple sequence alignment) indexing.
+    active_region_only : bool, optional
+        If True, only includes active site atoms in the network. Default is False.
+    directed : bool, optional
+        If True, constructs a directed network. Default is False.
+    angle_criteria : float or None, optional
+        Angle cutoff criteria for hydrogen-bonding structures. Default is None.
+    max_connection_distance : float, optional
+        Maximum distance (in Å) for defining connections in the network. Default is 3.0.
 
-    #extract coordinates from frame of interest
-    u.trajectory[frame_idx] 
+    Returns
+    -------
+    WaterNetwork
+        A `WaterNetwork` object representing the computed network for the given PDB.
+    """
+ 
+    #Static atom groups are selected once per worker
+    u, protein, ag_wat_all, ag_protein, max_distance = _get_frame_selections(pdb_file, trajectory_file, custom_selection, water_name, directed)
+
+    #extract coordinates from frame of interest -- read the next frame sequentially when frames come in order
+    if u.trajectory.ts.frame + 1 == frame_idx:
+        next(u.trajectory)
+    elif u.trajectory.ts.frame != frame_idx:
+        u.trajectory[frame_idx]
+
+    if protein is not None:
+        #Keep waters within the sphere around the protein center of geometry -- same as sphzone, without reparsing the selection
+        ag_wat = ag_wat_all[_sphere_rows(protein.center_of_geometry(), ag_wat_all.positions, max_distance+0.5, box=u.dimensions)]
+    else:
+        ag_wat = ag_wat_all
 
-    #Initiate active site reference atomgroup
+    #Initiate active site reference atomgroup -- selected on the current frame, so it does not need to update
     if active_region_reference is not None:
-        active_region_residue = u.select_atoms(active_region_reference, updating=True)
+        active_region_residue = u.select_atoms(active_region_reference)
     else:
         active_region_residue = None
 
@@ -1385,12 +1959,11 @@ def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type
     if network_type == 'water-protein':
         water_only = False
         #Add protein atoms to network
-        for atm in ag_protein.atoms:
-            try:
-                msa_resid = msa_indexing[atm.resid-1] #CHECK THIS 
-            except:
-                msa_resid = None
-            water_network.add_atom(atm.index, atm.name, atm.resname, *atm.position, atm.resid, msa_resid)
+        #Read atom attributes as arrays once rather than through each Atom object
+        msa_resids = _msa_lookup(msa_indexing, ag_protein.resids)
+        for index, name, resname, position, resid, msa_resid in zip(ag_protein.indices.tolist(), ag_protein.names, ag_protein.resnames, 
+                                                                   ag_protein.positions, ag_protein.resids.tolist(), msa_resids):
+            water_network.add_atom(index, name, resname, *position, resid, msa_resid)
     elif network_type == 'water-water':
         water_only = True
     else:
@@ -1398,9 +1971,8 @@ def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type
 
     #Add waters to network
     for mol in ag_wat.residues:
-        ats = [atom for atom in mol.atoms]
         #Water molecules are objects which contain H1, H2, O atoms
-        water_network.add_water(mol.resid, *ats, mol.resid)
+        water_network.add_water(mol.resid, *mol.atoms, mol.resid)
     #Either find connections among only oxygens in waters or add hydrogens as well
     if directed:
         water_network.generate_directed_network(u.dimensions, msa_indexing, active_region_residue, active_region_COM=active_region_COM, active_region_radius=active_region_radius, 
@@ -1413,13 +1985,212 @@ def extract_objects_per_frame(pdb_file, trajectory_file, frame_idx, network_type
     return water_network
 
 
+def _network_metadata(universe, network_type='water-protein', custom_selection=None, water_name=None, directed=False):
+    """
+    Collect the frame-invariant atom data used to build networks from a trajectory into arrays.
+
+    Atoms are chosen on the first frame, with the same selections as extract_objects_per_frame.
+
+    Parameters
+    ----------
+    universe : MDAnalysis Universe object
+        Universe containing the trajectory.
+    network_type : {'water-water', 'water-protein'}, optional
+        Type of network to construct. Default is 'water-protein'.
+    custom_selection : str or None, optional
+        MDAnalysis selection string for custom residue selections. Default is None.
+    water_name : str or None, optional
+        Name of water molecules in the system. Default is None.
+    directed : bool, optional
+        If True, include protein hydrogens bonded to H-bonding heavy atoms. Default is False.
+
+    Returns
+    -------
+    tuple
+        - dict of arrays describing the protein atoms and waters, and the radius of the water sphere (None if there is no protein)
+        - protein AtomGroup whose center of geometry is the center of the water sphere, or None
+        - indices of the atoms whose positions are needed for each frame
+    """
+    if network_type not in ('water-protein', 'water-water'):
+        raise ValueError("Provide a valid network type. Current valid network types include 'water-protein' or 'water-water'")
+
+    universe.trajectory[0]
+    protein, ag_wat_all, ag_protein, max_distance = _select_network_atoms(universe, custom_selection, water_name, directed)
+
+    #Protein atoms are only part of water-protein networks
+    if network_type == 'water-water' or ag_protein is None:
+        ag_protein = universe.atoms[[]]
+
+    metadata = {
+        'prot_idx': ag_protein.indices.astype(np.int64),
+        'prot_name': np.asarray(ag_protein.names, dtype=str),
+        'prot_resname': np.asarray(ag_protein.resnames, dtype=str),
+        'prot_resid': ag_protein.resids.astype(np.int64),
+        'wat_atoms': np.array([res.atoms.indices for res in ag_wat_all.residues], dtype=np.int64).reshape(-1,3),
+        'wat_resid': ag_wat_all.residues.resids.astype(np.int64),
+        'sphere_radius': None if max_distance is None else max_distance+0.5,
+    }
+    atom_indices = np.concatenate([metadata['prot_idx'], metadata['wat_atoms'].ravel()])
+    return metadata, protein, atom_indices
+
+def _iter_frame_blocks(universe, frames, atom_indices, protein, frames_per_task):
+    """
+    Yield positions, box dimensions and water sphere centers for blocks of consecutive frames.
+
+    Parameters
+    ----------
+    universe : MDAnalysis Universe object
+        Universe containing the trajectory.
+    frames : list
+        Frame indices to read.
+    atom_indices : np.ndarray
+        Indices of atoms whose positions are needed.
+    protein : MDAnalysis AtomGroup or None
+        Protein atoms whose center of geometry is the center of the water sphere.
+    frames_per_task : int
+        Number of frames per block.
+
+    Yields
+    ------
+    tuple
+        - (Nframes,N,3) float32 array of positions of atom_indices
+        - list of box dimensions (None if the trajectory has no box)
+        - (Nframes,3) array of protein centers of geometry, or None if there is no protein
+    """
+    for start in range(0, len(frames), frames_per_task):
+        block = frames[start:start+frames_per_task]
+        positions = np.empty((len(block), len(atom_indices), 3), dtype=np.float32)
+        boxes = []
+        centers = None if protein is None else np.empty((len(block), 3), dtype=np.float32)
+        for i, frame_idx in enumerate(block):
+            ts = universe.trajectory[frame_idx]
+            positions[i] = ts.positions[atom_indices]
+            boxes.append(None if ts.dimensions is None else np.array(ts.dimensions, dtype=np.float32))
+            if protein is not None:
+                centers[i] = protein.center_of_geometry()
+        yield positions, boxes, centers
+
+def _build_frame_networks(metadata, positions, boxes, centers, directed, generate_kwargs):
+    """
+    Build the networks of a block of frames from atom data arrays and the positions of each frame.
+
+    Parameters
+    ----------
+    metadata : dict
+        Atom data created by _network_metadata.
+    positions : np.ndarray
+        (Nframes,N,3) array of positions of the protein atoms followed by the water atoms of metadata.
+    boxes : list
+        Box dimensions of each frame.
+    centers : np.ndarray or None
+        Center of the water sphere in each frame, or None to keep all waters.
+    directed : bool
+        If True, generate directed networks.
+    generate_kwargs : dict
+        Keyword arguments passed to generate_directed_network or generate_oxygen_network.
+
+    Returns
+    -------
+    list
+        WaterNetwork for each frame.
+    """
+    n_protein = len(metadata['prot_idx'])
+    prot_name = metadata['prot_name'].tolist()
+    prot_resname = metadata['prot_resname'].tolist()
+    prot_idx = metadata['prot_idx'].tolist()
+    prot_resid = metadata['prot_resid'].tolist()
+    msa_resids = _msa_lookup(generate_kwargs.get('msa_indexing'), metadata['prot_resid'])
+    wat_resid = metadata['wat_resid'].tolist()
+    wat_atoms = metadata['wat_atoms'].tolist()
+
+    networks = []
+    for i, box in enumerate(boxes):
+        water_xyz = positions[i, n_protein:]
+
+        #Keep waters with an atom within the sphere around the protein
+        if centers is None:
+            kept = range(len(wat_resid))
+        else:
+            kept = np.unique(_sphere_rows(centers[i], water_xyz, metadata['sphere_radius'], box=box) // 3).tolist()
+
+        network = WaterNetwork()
+        for index, name, resname, position, resid, msa_resid in zip(prot_idx, prot_name, prot_resname, positions[i, :n_protein], prot_resid, msa_resids):
+            network.add_atom(index, name, resname, *position, resid, msa_resid)
+        water_xyz = water_xyz.reshape(-1,3,3)
+        for w in kept:
+            network._add_water_from_arrays(wat_resid[w], wat_atoms[w], water_xyz[w], wat_resid[w])
+
+        if directed:
+            network.generate_directed_network(box, **generate_kwargs)
+        else:
+            network.generate_oxygen_network(box, **generate_kwargs)
+        networks.append(network)
+    return networks
+
+def build_networks_over_trajectory(universe, frames=None, network_type='water-protein', custom_selection=None, water_name=None, 
+                                   msa_indexing=None, directed=False, n_jobs=-1, frames_per_task=50, **kwargs):
+    """
+    Build a water network for each frame of a trajectory in parallel.
+
+    Atoms are selected once, as in extract_objects_per_frame, and their indices, names and resids 
+    are sent to each worker as arrays. Workers receive only position arrays for each frame, never 
+    the Universe itself, and keep the waters within the sphere around the protein in each frame. 
+    The networks are the same as those built by extract_objects_per_frame.
+
+    Parameters
+    ----------
+    universe : MDAnalysis Universe object
+        Universe containing the trajectory.
+    frames : iterable or None, optional
+        Frame indices to process. Default is None (all frames).
+    network_type : {'water-water', 'water-protein'}, optional
+        Type of network to construct. Default is 'water-protein'.
+    custom_selection : str or None, optional
+        MDAnalysis selection string for custom residue selections. Default is None.
+    water_name : str or None, optional
+        Name of water molecules in the system. Default is None.
+    msa_indexing : list or None, optional
+        List of MSA residue indexes. Default is None.
+    directed : bool, optional
+        If True, constructs directed networks. Default is False.
+    n_jobs : int, optional
+        Number of joblib workers. Default is -1 (all cores).
+    frames_per_task : int, optional
+        Number of consecutive frames sent to a worker at once. Default is 50.
+    **kwargs
+        Passed to generate_directed_network or generate_oxygen_network (e.g. max_connection_distance, 
+        angle_criteria). Active site references are not supported since AtomGroups cannot be sent to 
+        workers; use initialize_network for active site analysis.
+
+    Returns
+    -------
+    list
+        WaterNetwork objects, one per frame.
+    """
+    if kwargs.get('active_region_reference') is not None:
+        raise ValueError('active_region_reference is not supported by build_networks_over_trajectory, use initialize_network instead')
+
+    if frames is None:
+        frames = range(len(universe.trajectory))
+    frames = list(frames)
+
+    metadata, protein, atom_indices = _network_metadata(universe, network_type=network_type, custom_selection=custom_selection, 
+                                                        water_name=water_name, directed=directed)
+
+    generate_kwargs = dict(kwargs, msa_indexing=msa_indexing, water_only=(network_type == 'water-water'))
+
+    results = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_build_frame_networks)(metadata, positions, boxes, centers, directed, generate_kwargs) 
+        for positions, boxes, centers in _iter_frame_blocks(universe, frames, atom_indices, protein, frames_per_task))
+    return list(chain.from_iterable(results))
+
 def initialize_network(topology_file, trajectory_file, structure_directory='.', network_type='water-protein', 
                        include_hydrogens=False, custom_selection=None, active_region_reference=None, active_region_COM=False, active_region_only=False, 
                        active_region_radius=8.0, water_name=None, multi_model_pdb=False, max_distance=3.0, angle_criteria=None,
                        analysis_conditions='all', analysis_selection='all', project_networks=False, return_network=False, 
                        cluster_coordinates=False, clustering_method='hdbscan', min_cluster_samples=15, eps=None, msa_indexing=True, 
                        alignment_file='alignment.txt', combined_fasta='all_seqs.fa', fasta_directory='fasta', classify_water=False,
-                       classification_file_base='DYNAMIC', MSA_reference_pdb=None, water_reference_resids=None,  num_workers=4, shortest_path_nodes=None):
+                       classification_file_base='DYNAMIC', MSA_reference_pdb=None, water_reference_resids=None,  num_workers=4, shortest_path_nodes=None, backend=None):
     
     """
     Initialize and compute all water networks per frame for a trajectory.
@@ -1493,6 +2264,8 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
         Number of CPU cores to use for parallel computation. Default is 4.
     shortest_path_nodes : list, optional
         List of tuples of nodes to perform shortest path analysis among. Default is None (shortest path among entire network will be returned)
+    backend : str or None, optional
+        NetworkX dispatch backend (e.g. 'cugraph' or 'parallel') used for clustering coefficients and shortest paths, if installed. Default is None.
 
     Returns
     -------
@@ -1505,7 +2278,7 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             Dictionary of cluster centers (if clustering is on)
 
     """
-    def process_frame(frame_idx, coords=None, ref_coords=None, residues=None):
+    def process_frame(frame_idx, coords=None, ref_coords=None, msa_indices=None):
         """
         Internal function to make parallelizing each frame easier
 
@@ -1515,22 +2288,6 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
 
         print(f"Processing frame {frame_idx}")
 
-        #If an MSA has been performed
-        if msa_indexing == True:
-
-            #Assuming fasta file is named similarly to the pdb -- need sequence files for MSA alignment
-            try:
-                fasta_individual = [f for f in os.listdir(fasta_directory) if (topology_file.split('.')[0].split('_')[0] in f and 'fa' in f)][0]
-                #Generate MSA if file does not exist and output MSA indices corresponding to partcicular sequence
-                msa_indices = sequence_processing.generate_msa_alignment(alignment_file, combined_fasta, os.path.join(fasta_directory, fasta_individual))
-            #If MSA cannot be done, use residues as msa_indices
-            except:
-                print(f'Warning: Could not find an equivalent fasta file for {pdb_file}. Check your naming schemes!')
-                msa_indices = residues
-
-        else:
-            msa_indices = None
-
         if active_region_reference is not None and MSA_reference_pdb is not None:
             u = mda.Universe(os.path.join(pdb_dir, pdb_file))
             resids = u.residues.resids.tolist()
@@ -1592,28 +2349,20 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
 
         metrics = {}
         #Calculate metrics as per user input
-        if analysis_conditions['density'] == 'on':
-            metrics['density'] = network.get_density(selection=analysis_selection)
-        if analysis_conditions['connected_components'] == 'on':
-            metrics['connected_components'] = network.get_connected_components(selection=analysis_selection)
-        if analysis_conditions['interaction_counts'] == 'on':
-            metrics['interaction_counts'] = network.get_interactions()
-        if analysis_conditions['per_residue_interactions'] == 'on':
-            metrics['per_residue_interaction'] = network.get_per_residue_interactions(selection=analysis_selection)
-        if analysis_conditions['characteristic_path_length'] == 'on':
-            metrics['characteristic_path_length'] = network.get_CPL(selection=analysis_selection)
-        if analysis_conditions['graph_entropy'] == 'on':
-            metrics['entropy'] = network.get_entropy(selection=analysis_selection)
-        if analysis_conditions['clustering_coefficient'] == 'on':
-            metrics['clustering_coefficient'] = network.get_clustering_coefficient(selection=analysis_selection)
+        for key, method, uses_selection, uses_backend in enabled_metrics:
+            kwargs = {'backend': backend} if uses_backend else {}
+            if uses_selection:
+                metrics[key] = getattr(network, method)(selection=analysis_selection, **kwargs)
+            else:
+                metrics[key] = getattr(network, method)(**kwargs)
 
         if analysis_conditions['shortest_path'] == 'on':
             if shortest_path_nodes is None:
-                metrics['shortest_path'] = network.get_shortest_path(selection=analysis_selection)
+                metrics['shortest_path'] = network.get_shortest_path(selection=analysis_selection, backend=backend)
             else:
                 metrics['shortest_path'] = []
                 for (source, target) in shortest_path_nodes:
-                    metrics['shortest_path'].append(network.get_shortest_path(selection=analysis_conditions, source=source, target=target))
+                    metrics['shortest_path'].append(network.get_shortest_path(selection=analysis_conditions, source=source, target=target, backend=backend))
         #clustering coefficient -- https://www.annualreviews.org/content/journals/10.1146/annurev-physchem-050317-020915
 
         #Classify waters
@@ -1631,10 +2380,8 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
 
             classification_dict = residue_analysis.classify_waters(network, ref1_coords=ref_coords[0], ref2_coords=ref2_coords)
 
-            #Write classification dict into a csv file
-            with open(f'msa_classification/{classification_file_base}.csv', 'a') as FILE:
-                for key, val in classification_dict.items():
-                        FILE.write(f"{frame_idx},{key},{val[0]},{val[1]}\n")
+            #Rows of the classification csv file are written by the parent process
+            metrics['classification_rows'] = ''.join([f"{frame_idx},{key},{val[0]},{val[1]}\n" for key, val in classification_dict.items()])
 
         #Save coodinates for clustering
         if coords is not None:
@@ -1643,8 +2390,7 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             else:
                 selection='all'
 
-            coords = network.get_all_coordinates(selection=selection)
-            metrics['coordinates'] = np.array(coords).reshape(-1,3)
+            metrics['coordinates'] = network.get_all_coordinates(selection=selection)
 
         #Create pymol projections for each frame
         if project_networks:
@@ -1655,8 +2401,19 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             return (metrics, network)
         else:
             return(metrics, None)
-        
 
+    def process_chunk(frame_indices, coords=None, ref_coords=None, msa_indices=None):
+        """
+        Internal function to process a contiguous block of frames in one worker
+
+        Returns:
+        List of (metrics, network) for each frame in the block
+        """
+        try:
+            return [process_frame(frame_idx, coords, ref_coords, msa_indices) for frame_idx in frame_indices]
+        finally:
+            #Close the trajectory opened for this block -- joblib reuses worker processes
+            clear_trajectory_caches()
     
     #Get pdb and traj file
     pdb_file = os.path.join(structure_directory, topology_file)
@@ -1674,6 +2431,9 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             'shortest_path': 'on'
         }
 
+    #Metrics switched on in analysis_conditions, resolved once for all frames
+    enabled_metrics = [_METHOD[key] for key, val in analysis_conditions.items() if key in _METHOD and val == 'on']
+
     #Create universe object just once to get number of frames
     try:
         u = mda.Universe(pdb_file, traj_file)
@@ -1689,6 +2449,22 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             u = mda.Universe(pdb_file)
             frames = 0
 
+    #If an MSA has been performed -- MSA indices are identical for every frame, so align once here
+    if msa_indexing == True:
+
+        #Assuming fasta file is named similarly to the pdb -- need sequence files for MSA alignment
+        try:
+            fasta_individual = [f for f in os.listdir(fasta_directory) if (topology_file.split('.')[0].split('_')[0] in f and 'fa' in f)][0]
+            #Generate MSA if file does not exist and output MSA indices corresponding to partcicular sequence
+            msa_indices = sequence_processing.generate_msa_alignment(alignment_file, combined_fasta, os.path.join(fasta_directory, fasta_individual))
+        #If MSA cannot be done, use residues as msa_indices
+        except:
+            print(f'Warning: Could not find an equivalent fasta file for {pdb_file}. Check your naming schemes!')
+            msa_indices = residues
+
+    else:
+        msa_indices = None
+
     #Initialize empty list to collect coordinates if clustering
     if cluster_coordinates:
         coords = []
@@ -1714,9 +2490,17 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
             FILE.write('Frame Index,Resid,MSA_Resid,Index_1,Index_2,Protein_Atom,Classification,Protein_Coords,Water_Coords,Angle_1,Angle_2\n')
 
 
-    #Parallelized so there is one worker allocated for each frame
-    results = Parallel(n_jobs=num_workers)(delayed(process_frame)(frame_idx, coords, ref_coords, residues) for frame_idx in range(frames))
+    #Parallelized over contiguous blocks of frames, so each worker reads its frames sequentially
+    chunks = [f for f in np.array_split(np.arange(frames), min(effective_n_jobs(num_workers), max(frames, 1))) if len(f) > 0]
+    results = Parallel(n_jobs=num_workers, backend='loky')(delayed(process_chunk)(chunk.tolist(), coords, ref_coords, msa_indices) for chunk in chunks)
+    results = list(chain.from_iterable(results))
     network_metrics, networks = zip(*results)
+
+    #Write classification dict of every frame into a csv file, in frame order
+    if classify_water:
+        with open(f'msa_classification/{classification_file_base}.csv', 'a') as FILE:
+            FILE.write(''.join([f.pop('classification_rows', '') for f in network_metrics]))
+
     #Cluster coordinates after networks are created returns metrics and centers
     if cluster_coordinates:
         print('Clustering...')
@@ -1725,7 +2509,7 @@ def initialize_network(topology_file, trajectory_file, structure_directory='.',
         coordinates = [
             f['coordinates'] for f in network_metrics if f['coordinates'].shape[1] == 3
         ]
-        combined_coordinates = np.concatenate([arr for arr in coordinates], axis=0)
+        combined_coordinates = _combine_coordinates(coordinates)
 
         cluster_labels, cluster_centers = get_clusters(combined_coordinates, cluster=clustering_method, min_samples=min_cluster_samples, eps=eps, n_jobs=num_workers, filename_base=classification_file_base)
         return (network_metrics, networks, cluster_centers)
@@ -3,10 +3,13 @@ Generate water networks based on static structures
 """
 
 import os, sys
+from collections import defaultdict
+from itertools import chain
 import numpy as np
 import MDAnalysis as mda
 from MDAnalysis.analysis import distances
 import networkx as nx
+from scipy.sparse import csr_matrix, csgraph
 import matplotlib.pyplot as plt
 from joblib import Parallel, delayed
 from scipy.spatial import cKDTree
@@ -24,7 +27,7 @@ class WaterAtom:
     ----------
     index : int
         PDB atom index
-    coordinates : tuple
+    coordinates : np.ndarray
         Coordinates of atom
     resname : str
         Name of residue. Default is WAT.
@@ -53,7 +56,7 @@ class WaterAtom:
             z-coordinate of position
         """
         self.index = index
-        self.coordinates = (x, y, z)
+        self.coordinates = np.array((x, y, z), dtype=np.float32)
         self.resname = 'WAT'
         self.name = atom_name
         self.resid = residue_number
@@ -109,7 +112,7 @@ class OtherAtom:
     ----------
     index : int
         PDB atom index
-    coordinates : tuple
+    coordinates : np.ndarray
         Coordinates of atom
     resname : str
         Name of residue.
@@ -142,13 +145,363 @@ class OtherAtom:
             Residue number of atom
         """
         self.index = index
-        self.coordinates = (x, y, z)
+        self.coordinates = np.array((x, y, z), dtype=np.float32)
         self.resname = residue_name
         self.msa_resid = msa_residue_number
         self.resid = residue_number
         self.name = atom_name
         #self.hbonding = hbonding  #Commenting out currently
+        self.hbonding_type = _classify_protein_atom(atom_name)
   
+#Categories of protein atoms for hydrogen bonding
+HBOND_HEAVY = 0
+HBOND_HYDROGEN = 1
+HBOND_NONE = 2
+
+#Kinds of points in the combined donor/acceptor search
+POINT_WATER_O = 0
+POINT_WATER_H = 1
+POINT_PROTEIN_HEAVY = 2
+POINT_PROTEIN_H = 3
+
+#Network metrics -- analysis_conditions key: (metrics key, WaterNetwork method, whether the method takes a selection, whether it takes a NetworkX backend)
+_METHOD = {
+    'density': ('density', 'get_density', True, False),
+    'connected_components': ('connected_components', 'get_connected_components', True, False),
+    'interaction_counts': ('interaction_counts', 'get_interactions', False, False),
+    'per_residue_interactions': ('per_residue_interaction', 'get_per_residue_interactions', True, False),
+    'characteristic_path_length': ('characteristic_path_length', 'get_CPL', True, False),
+    'graph_entropy': ('entropy', 'get_entropy', True, False),
+    'clustering_coefficient': ('clustering_coefficient', 'get_clustering_coefficient', True, True),
+}
+
+def _classify_protein_atom(atom_name):
+    """
+    Categorize a protein atom by its element as a hydrogen bonding heavy atom (N, O, P, S), a hydrogen, or neither
+
+    Parameters
+    ----------
+    atom_name : str
+        Name of atom
+
+    Returns
+    -------
+    int
+        One of HBOND_HEAVY, HBOND_HYDROGEN or HBOND_NONE
+    """
+    #Element is the first letter of the atom name, skipping PDB-style leading digits (e.g. 1HD2)
+    element = atom_name.lstrip('0123456789')[:1]
+    if element in ('N', 'O', 'P', 'S'):
+        return HBOND_HEAVY
+    elif element == 'H':
+        return HBOND_HYDROGEN
+    return HBOND_NONE
+
+def _stack_waters(waters):
+    """
+    Stack attributes of WaterMolecule objects into contiguous arrays
+
+    Parameters
+    ----------
+    waters : list
+        List of WaterMolecule objects
+
+    Returns
+    -------
+    tuple
+        - (N,3) float32 array of oxygen coordinates
+        - (2*N_H,3) float32 array of hydrogen coordinates (H1, H2 of each water in turn)
+        - array of oxygen indices
+        - array of water resids
+        - array giving the position of the parent water of each hydrogen
+    """
+    has_H = [i for i, mol in enumerate(waters) if mol.H1 is not None]
+
+    #Fill preallocated arrays instead of converting nested lists of tuples
+    O_xyz = np.empty((len(waters), 3), dtype=np.float32)
+    H_xyz = np.empty((2*len(has_H), 3), dtype=np.float32)
+    if len(waters) > 0:
+        np.stack([mol.O.coordinates for mol in waters], out=O_xyz)
+    if len(has_H) > 0:
+        H_xyz[0::2] = np.stack([waters[i].H1.coordinates for i in has_H])
+        H_xyz[1::2] = np.stack([waters[i].H2.coordinates for i in has_H])
+    O_idx = np.fromiter((mol.O.index for mol in waters), dtype=np.int32, count=len(waters))
+    resid = np.array([mol.resid for mol in waters])
+    H_owner = np.repeat(np.array(has_H, dtype=np.int64), 2)
+    return O_xyz, H_xyz, O_idx, resid, H_owner
+
+def _stack_protein(protein):
+    """
+    Stack attributes of OtherAtom objects into contiguous arrays
+
+    Parameters
+    ----------
+    protein : list
+        List of OtherAtom objects
+
+    Returns
+    -------
+    tuple
+        - (N,3) float32 array of coordinates
+        - array of atom indices
+        - array of resids
+        - array of atom names
+        - int8 array of hydrogen bonding categories
+    """
+    xyz = np.empty((len(protein), 3), dtype=np.float32)
+    if len(protein) > 0:
+        np.stack([atm.coordinates for atm in protein], out=xyz)
+    idx = np.fromiter((atm.index for atm in protein), dtype=np.int32, count=len(protein))
+    resid = np.array([atm.resid for atm in protein])
+    name = np.array([atm.name for atm in protein], dtype=str)
+    types = np.fromiter((atm.hbonding_type for atm in protein), dtype=np.int8, count=len(protein))
+    return xyz, idx, resid, name, types
+
+def _bond_angles(v1, v2):
+    """
+    Compute angles between paired rows of two arrays of vectors
+
+    Parameters
+    ----------
+    v1 : np.ndarray
+        (N,3) array of vectors
+    v2 : np.ndarray
+        (N,3) array of vectors
+
+    Returns
+    -------
+    np.ndarray
+        (N,) array of angles in degrees
+    """
+    #One square root per pair from the product of squared magnitudes
+    cosine = np.einsum('ij,ij->i', v1, v2) / np.sqrt(np.einsum('ij,ij->i', v1, v1) * np.einsum('ij,ij->i', v2, v2))
+    return np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+
+def _bounding_box_mask(coordinates, reference_positions, radius):
+    """
+    Flag coordinates inside the bounding box of the reference positions expanded by a radius
+
+    Parameters
+    ----------
+    coordinates : np.ndarray
+        (N,3) array of coordinates
+    reference_positions : np.ndarray
+        (M,3) array of reference coordinates, or (3,) array of a single reference point
+    radius : float
+        Distance added to each side of the bounding box
+
+    Returns
+    -------
+    np.ndarray
+        (N,) boolean array, True for coordinates which may be within radius of a reference position
+    """
+    #A single reference point (e.g. a center of mass) is a bounding box of zero size
+    reference_positions = np.atleast_2d(reference_positions)
+    box_min = reference_positions.min(axis=0) - radius
+    box_max = reference_positions.max(axis=0) + radius
+    return ((coordinates >= box_min) & (coordinates <= box_max)).all(axis=1)
+
+def _split_pairs(pairs, kind, offsets, first_kind, second_kind):
+    """
+    Select pairs between two kinds of points from a combined neighbor search
+
+    Parameters
+    ----------
+    pairs : np.ndarray
+        (Npairs,2) array of positions in the combined point set
+    kind : np.ndarray
+        Kind of each point in the combined point set
+    offsets : np.ndarray
+        Position of the first point of each kind in the combined point set
+    first_kind : int
+        Kind of point to list first
+    second_kind : int
+        Kind of point to list second
+
+    Returns
+    -------
+    tuple
+        - positions of the first points within their own kind
+        - positions of the second points within their own kind
+    """
+    pair_kind = kind[pairs]
+    forward = (pair_kind[:,0] == first_kind) & (pair_kind[:,1] == second_kind)
+    backward = (pair_kind[:,0] == second_kind) & (pair_kind[:,1] == first_kind)
+
+    first = np.concatenate([pairs[forward,0], pairs[backward,1]]) - offsets[first_kind]
+    second = np.concatenate([pairs[forward,1], pairs[backward,0]]) - offsets[second_kind]
+    order = np.lexsort((second, first))
+    return first[order], second[order]
+
+def _assemble_connections(first_indices, second_indices, first_names, interaction, in_active=None, 
+                          active_region_only=False, backbone=None):
+    """
+    Build connection tuples for a batch of atom pairs
+
+    Parameters
+    ----------
+    first_indices : np.ndarray
+        Atom indices of the first atom in each pair
+    second_indices : np.ndarray
+        Atom indices of the second atom in each pair
+    first_names : np.ndarray
+        Atom names of the first atom in each pair
+    interaction : str
+        Type of interaction ('WAT-WAT' or 'WAT-PROT')
+    in_active : np.ndarray, optional
+        Boolean array marking pairs involving the active site. None if no active site is defined.
+    active_region_only : bool, optional
+        If True, every pair is labelled as active site. Default is False.
+    backbone : np.ndarray, optional
+        Boolean array marking pairs with a protein backbone atom. Only given for 'WAT-PROT' interactions.
+
+    Returns
+    -------
+    list of tuples
+        Connections in the format returned by find_connections
+    """
+    n_pairs = len(first_indices)
+    if active_region_only:
+        site_status = ['active_region'] * n_pairs
+    elif in_active is None:
+        site_status = ['None'] * n_pairs
+    else:
+        site_status = np.where(in_active, 'active_region', 'not_active_region').tolist()
+
+    columns = [np.asarray(first_indices).tolist(), np.asarray(second_indices).tolist(), 
+               np.asarray(first_names).tolist(), [interaction] * n_pairs, site_status]
+    if backbone is not None:
+        columns.append(np.where(backbone, 'backbone', 'side-chain').tolist())
+    return list(zip(*columns))
+
+def _msa_lookup(msa_indexing, resids):
+    """
+    Look up the MSA residue number of each resid
+
+    Parameters
+    ----------
+    msa_indexing : list or None
+        MSA residue numbers, where entry resid-1 belongs to residue resid
+    resids : array-like
+        Residue numbers
+
+    Returns
+    -------
+    list
+        MSA residue number of each resid, or None where msa_indexing has no entry
+    """
+    if msa_indexing is None:
+        return [None] * len(resids)
+
+    msa_arr = np.asarray(msa_indexing, dtype=object)
+    positions = np.asarray(resids, dtype=np.int64) - 1
+
+    #Same bounds as list indexing, so negative positions still count from the end
+    valid = (positions >= -len(msa_arr)) & (positions < len(msa_arr))
+    msa_resids = np.full(len(positions), None, dtype=object)
+    msa_resids[valid] = msa_arr[positions[valid]]
+    return msa_resids.tolist()
+
+def _edge_adjacency(edge_list, n_nodes):
+    """
+    Build an unweighted CSR adjacency matrix from an edge list
+
+    Parameters
+    ----------
+    edge_list : np.ndarray
+        (Nedges,2) array of node positions
+    n_nodes : int
+        Number of nodes
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        (n_nodes, n_nodes) adjacency matrix
+    """
+    adjacency = csr_matrix((np.ones(len(edge_list), dtype=np.int8), (edge_list[:,0], edge_list[:,1])), shape=(n_nodes, n_nodes))
+    adjacency.data[:] = 1
+    return adjacency
+
+def _clustering_coefficients(adjacency):
+    """
+    Compute the clustering coefficient of every node of an undirected graph by triangle counting
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse matrix
+        Symmetric adjacency matrix of the graph. Weights and self-loops are ignored.
+
+    Returns
+    -------
+    np.ndarray
+        Clustering coefficient of each row of the adjacency matrix
+    """
+    #Drop self-loops and weights
+    coo = adjacency.tocoo()
+    off_diagonal = coo.row != coo.col
+    adjacency = csr_matrix((np.ones(np.count_nonzero(off_diagonal), dtype=np.int64), (coo.row[off_diagonal], coo.col[off_diagonal])), shape=coo.shape)
+    adjacency.data[:] = 1
+
+    #Each triangle through a node closes two of its paths of length 2
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    triangles = np.asarray((adjacency @ adjacency).multiply(adjacency).sum(axis=1)).ravel()/2
+    pairs = degree*(degree-1)
+    return np.divide(2*triangles, pairs, out=np.zeros(len(degree)), where=pairs>0)
+
+def _combine_coordinates(coordinates):
+    """
+    Copy per-frame coordinate arrays into one pre-sized float32 array
+
+    Parameters
+    ----------
+    coordinates : list of np.ndarray
+        (n, 3) coordinate arrays
+
+    Returns
+    -------
+    np.ndarray
+        (sum of n, 3) float32 array of all coordinates
+    """
+    sizes = np.fromiter((arr.shape[0] for arr in coordinates), dtype=np.int64, count=len(coordinates))
+    combined = np.empty((int(sizes.sum()), 3), dtype=np.float32)
+    offset = 0
+    for arr, size in zip(coordinates, sizes):
+        combined[offset:offset+size] = arr
+        offset += size
+    return combined
+
+
+def _average_path_length(adjacency, directed=False, block_size=1024):
+    """
+    Compute the average shortest path length between all pairs of nodes of a connected graph
+
+    Shortest paths are computed for blocks of source nodes so that the full 
+    distance matrix is never held in memory.
+
+    Parameters
+    ----------
+    adjacency : scipy.sparse.csr_matrix
+        Adjacency matrix of the graph
+    directed : bool, optional
+        Whether to follow edge directions. Default is False.
+    block_size : int, optional
+        Number of source nodes per block. Default is 1024.
+
+    Returns
+    -------
+    float
+        Average shortest path length (0 for graphs with a single node)
+    """
+    n_nodes = adjacency.shape[0]
+    if n_nodes < 2:
+        return 0.0
+
+    total = 0.0
+    for start in range(0, n_nodes, block_size):
+        sources = np.arange(start, min(start+block_size, n_nodes))
+        total += csgraph.shortest_path(adjacency, method='D', directed=directed, unweighted=True, indices=sources).sum()
+    return total / (n_nodes*(n_nodes-1))
+
 class WaterNetwork:  
     """
     Object for storing information regarding water-water and water-protein connections
@@ -178,6 +531,36 @@ class WaterNetwork:
         self.active_region = None
         self.graph = None
 
+        #CSR adjacency matrix of self.graph, with nodes in the order of self._node_ids
+        self.adjacency_csr = None
+        self._node_ids = None
+        self._edge_list = None
+        self._edge_status = None
+        self._edge_type = None
+
+        #Subgraphs and adjacency matrices of active site selections, cleared when the graph is rebuilt
+        self._sub_cache = {}
+
+        #Contiguous per-atom arrays (see _assemble_soa), rebuilt when atoms are added
+        self._soa_ready = False
+        self._wat_O_xyz = None
+        self._wat_H_xyz = None
+        self._wat_O_idx = None
+        self._wat_resid = None
+        self._wat_H_owner = None
+        self._prot_xyz = None
+        self._prot_idx = None
+        self._prot_resid = None
+        self._prot_name = None
+        self._prot_type = None
+        self._prot_heavy_rows = None
+        self._prot_H_rows = None
+
+        #Lookup tables used by the angle criteria in find_directed_connections
+        #(heavy atoms are stored as rows of _prot_xyz)
+        self._prot_by_index = None
+        self._prot_heavy_by_resid = None
+
     def add_atom(self, index, atom_name, residue_name, x, y, z, residue_number=None, msa_residue_number=None):
         """
         Add atom (OtherAtom object)
@@ -216,6 +599,7 @@ class WaterNetwork:
 
             mol = OtherAtom(index, atom_name, residue_name, x, y, z, residue_number, msa_residue_number, hbonding)
             self.protein_atoms.append(mol)
+        self._soa_ready = False
 
     def add_water(self, index, o, residue_number, h1=None, h2=None):
         """
@@ -248,6 +632,90 @@ class WaterNetwork:
 
         water = WaterMolecule(index, o, h1, h2, residue_number)
         self.water_molecules.append(water)
+        self._soa_ready = False
+
+    def _assemble_soa(self):
+        """
+        Collect per-atom attributes of all waters and protein atoms into contiguous arrays.
+
+        Neighbor searches and active site selection read these arrays instead of iterating 
+        over WaterMolecule and OtherAtom objects.
+
+        Returns
+        ----------
+        None
+        """
+        (self._wat_O_xyz, self._wat_H_xyz, self._wat_O_idx, 
+         self._wat_resid, self._wat_H_owner) = _stack_waters(self.water_molecules)
+        (self._prot_xyz, self._prot_idx, self._prot_resid, 
+         self._prot_name, self._prot_type) = _stack_protein(self.protein_atoms)
+
+        #Rows of H-bonding heavy atoms and hydrogens, so directed searches need no name checks
+        self._prot_heavy_rows = np.flatnonzero(self._prot_type == HBOND_HEAVY)
+        self._prot_H_rows = np.flatnonzero(self._prot_type == HBOND_HYDROGEN)
+
+        self._prot_by_index = {atm.index: atm for atm in self.protein_atoms}
+
+        heavy_by_resid = defaultdict(list)
+        for i, atm in enumerate(self.protein_atoms):
+            if atm.hbonding_type != HBOND_HYDROGEN:
+                heavy_by_resid[atm.resid].append(i)
+        self._prot_heavy_by_resid = {resid: np.array(rows, dtype=np.int64) for resid, rows in heavy_by_resid.items()}
+        self._soa_ready = True
+
+    def _get_arrays(self, water_active=None, protein_active=None, active_region_only=False):
+        """
+        Get stacked water and protein arrays for the whole network or only for the active site
+
+        Parameters
+        ----------
+        water_active : list
+            Selection of active site water molecules.
+        protein_active : list
+            Selection of active site protein molecules.
+        active_region_only : bool, optional
+            If True, stack only the active site atoms. Default is False.
+
+        Returns
+        -------
+        tuple
+            - water arrays as returned by _stack_waters
+            - protein arrays as returned by _stack_protein
+        """
+        if active_region_only:
+            return _stack_waters(water_active), _stack_protein(protein_active)
+
+        if not self._soa_ready:
+            self._assemble_soa()
+
+        return ((self._wat_O_xyz, self._wat_H_xyz, self._wat_O_idx, self._wat_resid, self._wat_H_owner),
+                (self._prot_xyz, self._prot_idx, self._prot_resid, self._prot_name, self._prot_type))
+
+    def _donor_heavy_coordinates(self, H_indices, H_coords):
+        """
+        Find the closest heavy atom in the same residue for each protein hydrogen
+
+        Parameters
+        ----------
+        H_indices : np.ndarray
+            Atom indices of protein hydrogens
+        H_coords : np.ndarray
+            (N,3) array of protein hydrogen coordinates
+
+        Returns
+        -------
+        np.ndarray
+            (N,3) array of heavy atom coordinates
+        """
+        if not self._soa_ready:
+            self._assemble_soa()
+
+        donor_coords = np.empty((len(H_indices), 3), dtype=np.float32)
+        for i, (index, coords) in enumerate(zip(H_indices, H_coords)):
+            heavy_coords = self._prot_xyz[self._prot_heavy_by_resid[self._prot_by_index[index].resid]]
+            offset = heavy_coords - coords
+            donor_coords[i] = heavy_coords[np.argmin(np.einsum('ij,ij->i', offset, offset))]
+        return donor_coords
 
     def select_active_region(self, reference, active_region_radius=8.0, active_region_COM=False):
         """
@@ -275,48 +743,50 @@ class WaterNetwork:
               Active site water atoms.  
         """
 
-        #Create empty set for active site atoms
-        active_region_atoms = []
-
         if active_region_COM is False:
             #Find coordinates for refrence point
-            reference_positions = np.array([ref.position for ref in reference])  # Precompute reference positions
+            reference_positions = np.array([ref.position for ref in reference], dtype=np.float32).reshape(-1,3)  # Precompute reference positions
 
         else:
-            reference_positions = reference.center_of_mass()
-
-        #Find protein atoms in active site
-        protein_active = []
+            reference_positions = reference.center_of_mass().astype(np.float32)
 
         reference_resids = {r.resid for r in reference}  # Set of reference resids for fast lookup
 
-        for atm in self.protein_atoms:
-            #Immediately include atoms which are a part of the reference
-            if atm.resid in reference_resids:
-                active_region_atoms.append(atm)
-
-            #Include atoms within a distance cutoff
-            else:
-                dist = np.min(distances.distance_array(np.array(atm.coordinates).reshape(1, -1), reference_positions))
-                if dist <= active_region_radius:
-                    active_region_atoms.append(atm)
-                    protein_active.append(atm)
-
-        #Find water molecules in active site
-        water_active = []
-
-        for mol in self.water_molecules:
-            if mol.H1 is not None:
-                #Include atoms within a distance cutoff
-                water_positions = np.array([mol.O.coordinates, mol.H1.coordinates, mol.H2.coordinates])
-            
-            else:
-                water_positions = np.array([mol.O.coordinates])
-
-            dist = np.min(distances.distance_array(water_positions, reference_positions))
-            if dist <= active_region_radius:            
-                active_region_atoms.append(mol)
-                water_active.append(mol)
+        if not self._soa_ready:
+            self._assemble_soa()
+
+        #Find protein atoms in active site -- distances are only computed inside the bounding box of the reference
+        in_reference = np.zeros(len(self.protein_atoms), dtype=bool)
+        within_cutoff = np.zeros(len(self.protein_atoms), dtype=bool)
+        if len(self.protein_atoms) > 0:
+            #Atoms which are a part of the reference are immediately included in the active site
+            in_reference = np.isin(self._prot_resid, list(reference_resids))
+            candidates = np.flatnonzero(_bounding_box_mask(self._prot_xyz, reference_positions, active_region_radius))
+            if len(candidates) > 0:
+                dist = distances.distance_array(self._prot_xyz[candidates], reference_positions).min(axis=1)
+                within_cutoff[candidates] = dist <= active_region_radius
+            within_cutoff &= ~in_reference
+
+        active_region_atoms = [self.protein_atoms[i] for i in np.flatnonzero(in_reference | within_cutoff)]
+        protein_active = [self.protein_atoms[i] for i in np.flatnonzero(within_cutoff)]
+
+        #Find water molecules in active site -- closest of O, H1, H2 to the reference
+        water_mask = np.zeros(len(self.water_molecules), dtype=bool)
+        if len(self.water_molecules) > 0:
+            water_dist = np.full(len(self.water_molecules), np.inf)
+            O_candidates = np.flatnonzero(_bounding_box_mask(self._wat_O_xyz, reference_positions, active_region_radius))
+            if len(O_candidates) > 0:
+                water_dist[O_candidates] = distances.distance_array(self._wat_O_xyz[O_candidates], reference_positions).min(axis=1)
+
+            H_candidates = np.flatnonzero(_bounding_box_mask(self._wat_H_xyz, reference_positions, active_region_radius))
+            if len(H_candidates) > 0:
+                H_dist = distances.distance_array(self._wat_H_xyz[H_candidates], reference_positions).min(axis=1)
+                np.minimum.at(water_dist, self._wat_H_owner[H_candidates], H_dist)
+
+            water_mask = water_dist <= active_region_radius
+
+        water_active = [self.water_molecules[i] for i in np.flatnonzero(water_mask)]
+        active_region_atoms.extend(water_active)
 
         self.active_region = list(active_region_atoms)  # Convert set back to list if order matters
         return self.active_region, list(protein_active), list(water_active)
@@ -356,59 +826,52 @@ class WaterNetwork:
         """
         connections = []
 
-        # Select active site atoms if specified
-        if active_region_only:
-            waters = water_active
-            protein = protein_active
+        # Gather contiguous arrays for the selected atoms
+        water_arrays, protein_arrays = self._get_arrays(water_active, protein_active, active_region_only)
+        water_coords, _, water_indices, water_resids, _ = water_arrays
+        water_names = np.full(len(water_coords), 'O')
 
-        else:
-            waters = self.water_molecules
-            protein = self.protein_atoms
+        if len(water_coords) == 0:
+            return connections  
 
-        # Extract water oxygen coordinates and indices
-        water_coords = np.array([mol.O.coordinates for mol in waters])
-        water_indices = np.array([mol.O.index for mol in waters])
-        water_names = np.array(['O' for _ in waters])
+        # Mark atoms belonging to active site residues
+        if self.active_region is not None:
+            active_resids = list({f.resid for f in self.active_region})
+            water_in_active = np.isin(water_resids, active_resids)
 
-        if len(water_coords.shape) != 2:
-            return connections  
-        # Water-Water connections
+        # Water-Water connections -- query_pairs returns every pair within the cutoff exactly once
         tree = cKDTree(water_coords)
-        dist, indices = tree.query(water_coords, k=10, distance_upper_bound=dist_cutoff)
-
-        for i, neighbors in enumerate(indices):
-            for j, neighbor in enumerate(neighbors):
-                if neighbor != i and dist[i, j] <= dist_cutoff:
-                    site_status = (
-                        'None' if self.active_region is None else
-                        'active_region' if any(waters[i].resid == f.resid for f in self.active_region) else
-                        'not_active_region'
-                    )
-                    if water_indices[i] < water_indices[neighbor]:
-                        connections.append((water_indices[i], water_indices[neighbor], water_names[i], 'WAT-WAT', site_status))
+        pairs = tree.query_pairs(r=dist_cutoff, output_type='ndarray')
+
+        # List the water with the lower atom index first
+        swap = water_indices[pairs[:,0]] > water_indices[pairs[:,1]]
+        pairs[swap] = pairs[swap][:, ::-1]
+        pairs = pairs[np.lexsort((pairs[:,1], pairs[:,0]))]
+        i, neighbor = pairs[:,0], pairs[:,1]
+
+        in_active = None if self.active_region is None else (water_in_active[i] | water_in_active[neighbor])
+        connections.extend(_assemble_connections(water_indices[i], water_indices[neighbor], water_names[i], 'WAT-WAT', in_active))
 
         # Water-Protein connections
         if not water_only:
-            protein_coords = np.array([atm.coordinates for atm in protein])
-            protein_indices = np.array([atm.index for atm in protein])
-            protein_names = np.array([atm.name for atm in protein])
-
-            tree = cKDTree(protein_coords)
-            dist, indices = tree.query(water_coords, k=10, distance_upper_bound=dist_cutoff)
-
-            for i, neighbors in enumerate(indices):
-                for j, neighbor in enumerate(neighbors):
-                    if dist[i, j] <= dist_cutoff:
-                        site_status = (
-                            'None' if self.active_region is None else
-                            'active_region' if any(waters[i].resid == f.resid or protein[neighbor].resid == f.resid for f in self.active_region) else
-                            'not_active_region'
-                        )
-                        if protein_names[neighbor] == 'O' or protein_names[neighbor] == 'N':
-                            classification = 'backbone'
-                        else:
-                            classification = 'side-chain'
-                        connections.append((protein_indices[neighbor], water_indices[i], protein_names[neighbor], 'WAT-PROT', site_status, classification))
+            protein_coords, protein_indices, protein_resids, protein_names, _ = protein_arrays
+
+            # query_ball_point lists all waters within the cutoff of each protein atom, using all cores
+            neighbor_lists = tree.query_ball_point(protein_coords, r=dist_cutoff, workers=-1, return_sorted=False)
+            counts = np.fromiter((len(f) for f in neighbor_lists), dtype=np.int64, count=len(neighbor_lists))
+            neighbor = np.repeat(np.arange(len(neighbor_lists)), counts)
+            i = np.fromiter(chain.from_iterable(neighbor_lists), dtype=np.int64, count=counts.sum())
+            order = np.lexsort((neighbor, i))
+            i, neighbor = i[order], neighbor[order]
+
+            if self.active_region is None:
+                in_active = None
+            else:
+                in_active = water_in_active[i] | np.isin(protein_resids, active_resids)[neighbor]
+            backbone = np.isin(protein_names[neighbor], ['O', 'N'])
+            connections.extend(_assemble_connections(protein_indices[neighbor], water_indices[i], protein_names[neighbor], 
+                                                     'WAT-PROT', in_active, backbone=backbone))
+
         return connections
 
     def find_directed_connections(self, dist_cutoff=2.0, water_active=None, protein_active=None, active_region_only=False, 
@@ -450,208 +913,102 @@ class WaterNetwork:
         # Initialize empty list for connections
         connections = []
 
-        # Select active site atoms if specified
-        if active_region_only:
-            waters = water_active
-            protein = protein_active
-        else:
-            waters = self.water_molecules
-            protein = self.protein_atoms
+        # Gather contiguous arrays for the selected atoms
+        water_arrays, protein_arrays = self._get_arrays(water_active, protein_active, active_region_only)
+        water_O_coords, water_H_coords, water_O_indices, _, water_H_owner = water_arrays
 
-        # Gather water indices and coordinates
-        water_H_indices = []
-        water_H_coords = []
-        water_H_names = []
+        #Index lookups for the angle criteria always cover the whole network
+        if angle_criteria is not None and not self._soa_ready:
+            self._assemble_soa()
 
-        water_O_coords = []
-        water_O_indices = []
-        water_O_names = []
+        # Hydrogens are labelled with the index of their parent oxygen
+        water_H_indices = water_O_indices[water_H_owner]
+        water_H_names = np.tile(['H1', 'H2'], len(water_H_coords)//2)
 
-        for mol in waters:
+        # Mark atoms belonging to the active site
+        if self.active_region is not None:
+            active_indices = list({f.index for f in self.active_region})
+            water_in_active = np.isin(water_O_indices, active_indices)
 
-            #Select status
-            if self.active_region is None:
-                site_status = 'None'
-            elif mol in self.active_region:
-                site_status = 'active_region'
+        if water_only == False:
+            #Split protein atoms into H-bonding heavy atoms and hydrogens
+            protein_coords, protein_indices, _, protein_names, protein_types = protein_arrays
+            if active_region_only:
+                heavy = np.flatnonzero(protein_types == HBOND_HEAVY)
+                hydrogen = np.flatnonzero(protein_types == HBOND_HYDROGEN)
             else:
-                site_status = 'not_active_region'
-
-            # Add H1 atom
-            water_H_indices.append(mol.O.index)  #Use only O index
-            water_H_coords.append(mol.H1.coordinates)
-            water_H_names.append('H1')
+                heavy, hydrogen = self._prot_heavy_rows, self._prot_H_rows
 
-            # Add H2 atom
-            water_H_indices.append(mol.O.index) #Use only O index
-            water_H_coords.append(mol.H2.coordinates)
-            water_H_names.append('H2')
+            protO_coords, protO_indices = protein_coords[heavy], protein_indices[heavy]
+            protH_coords, protH_indices, protH_names = protein_coords[hydrogen], protein_indices[hydrogen], protein_names[hydrogen]
 
-            # Add O
-            water_O_indices.append(mol.O.index)
-            water_O_coords.append(mol.O.coordinates)
-            water_O_names.append('O')
+            if self.active_region is not None:
+                protein_in_active = np.isin(protein_indices, active_indices)
+                protO_in_active, protH_in_active = protein_in_active[heavy], protein_in_active[hydrogen]
 
-        # Convert water_coords to a numpy array
-        water_H_coords = np.array(water_H_coords).reshape(-1,3)
-        water_O_coords = np.array(water_O_coords).reshape(-1,3)
+        #Search all donors and acceptors at once over a single labelled point set
+        groups = [water_O_coords, water_H_coords]
+        if water_only == False:
+            groups.extend([protO_coords, protH_coords])
+        points = np.vstack(groups)
+        kind = np.repeat(np.arange(len(groups), dtype=np.int8), [len(f) for f in groups])
+        offsets = np.cumsum([0] + [len(f) for f in groups])
+        pairs = cKDTree(points).query_pairs(r=dist_cutoff, output_type='ndarray')
 
         #Find protein-water connections
         if water_only == False:
 
-            #Gather indices and coords
-            protO_coords = []
-            protO_indices = []        
-            protO_names = []
-
-            protH_coords = []
-            protH_indices = []
-            protH_names = []
+            #Find distances between protein H and water O
+            water_pos, protH_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_O, POINT_PROTEIN_H)
 
-            for atm in protein:
-                if 'P' in atm.name or 'O' in atm.name or 'N' in atm.name or 'S' in atm.name:
-                    protO_coords.append(atm.coordinates)
-                    protO_indices.append(atm.index)
-                    protO_names.append(atm.name)
+            #Apply angle criteria to all pairs at once, measuring the angle at the protein hydrogen
+            if angle_criteria is not None and len(water_pos) > 0:
+                H_unique, H_inverse = np.unique(protH_pos, return_inverse=True)
+                donor_coords = self._donor_heavy_coordinates(protH_indices[H_unique], protH_coords[H_unique])[H_inverse]
 
-                elif 'H' in atm.name:
-                    protH_coords.append(atm.coordinates)
-                    protH_indices.append(atm.index)
-                    protH_names.append(atm.name)
+                H_water = water_O_coords[water_pos] - protH_coords[protH_pos]
+                H_donor = donor_coords - protH_coords[protH_pos]
+                keep = np.where(_bond_angles(H_water, H_donor) >= angle_criteria)[0]
+                water_pos, protH_pos = water_pos[keep], protH_pos[keep]
 
-            protH_coords = np.array(protH_coords).reshape(-1,3)
-            protO_coords = np.array(protO_coords).reshape(-1,3)
+            in_active = None if self.active_region is None else (water_in_active[water_pos] | protH_in_active[protH_pos])
+            connections.extend(_assemble_connections(protH_indices[protH_pos], water_O_indices[water_pos], protH_names[protH_pos], 
+                                                     'WAT-PROT', in_active, active_region_only))
 
-            #Find distances between protein H and water O
+            #Find distances between protein O,S,P,N and water H
+            H_pos, protO_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_H, POINT_PROTEIN_HEAVY)
 
-            #Create KDTree using protein-H coordinates
-            tree = cKDTree(protH_coords)
-
-            #Query for distances with water O coordinates
-            dist, indices = tree.query(water_O_coords, k=10, distance_upper_bound=dist_cutoff)
-
-            for index_near, index_ref in enumerate(indices):
-                for i, distance in enumerate(dist[index_near]):
-                    #Check for cutoff, scipy will output infs if distance is too high
-                    if distance <= dist_cutoff:
-                        if not active_region_only:
-                            # Determine active site status
-                            if self.active_region is None:
-                                site_status = 'None'
-                            elif any(idx in [water_H_indices[index_near], protH_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                                site_status = 'active_region'
-                            else:
-                                site_status = 'not_active_region'
-                        else: 
-                            site_status = 'active_region'
-
-                        #Append connections
-                        if angle_criteria is None:
-                            connections.append([protH_indices[index_ref[i]], water_O_indices[index_near], protH_names[index_ref[i]] , 'WAT-PROT', site_status])
-                        else:
-                            protein_hydrogen_coords = protH_coords[index_ref[i]]
-                            water_oxygen_coords = water_O_coords[index_near]
-
-                            protein_resid = [atm.resid for atm in self.protein_atoms if atm.index == protH_indices[index_ref[i]]][0]
-                            protein_O_coordinates = [atm.coordinates for atm in self.protein_atoms if (atm.resid == protein_resid and 'H' not in atm.name)]
-                            distances = [np.linalg.norm(protein_hydrogen_coords-f) for f in protein_O_coordinates]
-                            arg = np.argmin(distances)
-
-                            prot_heavy_coordinates = protein_O_coordinates[arg]
-
-                            prot_water = protein_hydrogen_coords - water_oxygen_coords
-                            prot_prot = prot_heavy_coordinates - protein_hydrogen_coords
-
-                            cosine_angle = np.dot(prot_water, prot_prot) / (np.linalg.norm(prot_water) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            if angle1 >= angle_criteria:
-                                connections.append([protH_indices[index_ref[i]], water_O_indices[index_near], protH_names[index_ref[i]] , 'WAT-PROT', site_status])
+            #Apply angle criteria to all pairs at once, comparing water O->acceptor with water H->O
+            if angle_criteria is not None and len(H_pos) > 0:
+                donor_coords = water_O_coords[water_H_owner[H_pos]]
 
-            #Find distances between protein O,S,P,N and water H
+                O_acceptor = protO_coords[protO_pos] - donor_coords
+                H_O = donor_coords - water_H_coords[H_pos]
+                keep = np.where(_bond_angles(O_acceptor, H_O) >= angle_criteria)[0]
+                H_pos, protO_pos = H_pos[keep], protO_pos[keep]
 
-            #Create KDTree using protein OSPN coordinates
-            tree = cKDTree(protO_coords)
-
-            #Query for distances with water-H coords
-            dist, indices = tree.query(water_H_coords, k=10, distance_upper_bound=dist_cutoff)
-            for index_near, index_ref in enumerate(indices):
-                for i, distance in enumerate(dist[index_near]):
-                    if distance <= dist_cutoff:        
-                        if not active_region_only:
-                            # Determine active site status
-                            if self.active_region is None:
-                                site_status = 'None'
-                            elif any(idx in [water_H_indices[index_near], protO_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                                site_status = 'active_region'
-                            else:
-                                site_status = 'not_active_region'
-                        else: 
-                            site_status = 'active_region'
-
-                        #Append connections
-                        if angle_criteria is None:
-                            connections.append([water_H_indices[index_near], protO_indices[index_ref[i]], water_H_names[index_near], 'WAT-PROT', site_status])
-                        else:
-                            protein_heavy_coords = protO_coords[index_ref[i]]
-                            water_hydrogen_coords = water_H_coords[index_near]
-                            water_o_coords = [water.O.coordinates for water in self.water_molecules if (water.O.index == water_H_indices[index_near])]
-
-                            prot_water = protein_heavy_coords - water_o_coords
-                            water1 = water_o_coords - water_hydrogen_coords
-
-                            cosine_angle = np.dot(prot_water, water1) / (np.linalg.norm(prot_water) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            if angle1 >= angle_criteria:
-                                connections.append([water_H_indices[index_near], protO_indices[index_ref[i]], water_H_names[index_near], 'WAT-PROT', site_status])
+            in_active = None if self.active_region is None else (water_in_active[water_H_owner[H_pos]] | protO_in_active[protO_pos])
+            connections.extend(_assemble_connections(water_H_indices[H_pos], protO_indices[protO_pos], water_H_names[H_pos], 
+                                                     'WAT-PROT', in_active, active_region_only))
 
+        #Find distances between water H and water O
+        H_pos, O_pos = _split_pairs(pairs, kind, offsets, POINT_WATER_H, POINT_WATER_O)
 
-            
-        #Find distances between water O and water H
+        #Check to make sure connection is not within the same water, and list each pair of waters only once
+        keep = water_H_indices[H_pos] < water_O_indices[O_pos]
+        H_pos, O_pos = H_pos[keep], O_pos[keep]
 
-        #Create KDTree for water-O coords
-        tree = cKDTree(water_O_coords)
+        #Apply angle criteria to all pairs at once, measuring the angle at the donor hydrogen
+        if angle_criteria is not None and len(H_pos) > 0:
+            H_acceptor = water_H_coords[H_pos] - water_O_coords[O_pos]
+            H_donor = water_H_coords[H_pos] - water_O_coords[water_H_owner[H_pos]]
+            keep = np.where(_bond_angles(H_acceptor, H_donor) >= angle_criteria)[0]
+            H_pos, O_pos = H_pos[keep], O_pos[keep]
 
-        #Query for distances with water-H coords
-        dist, indices = tree.query(water_H_coords, k=5, distance_upper_bound=dist_cutoff)
+        in_active = None if self.active_region is None else (water_in_active[water_H_owner[H_pos]] | water_in_active[O_pos])
+        connections.extend(_assemble_connections(water_H_indices[H_pos], water_O_indices[O_pos], water_H_names[H_pos], 
+                                                 'WAT-WAT', in_active, active_region_only))
 
-        
-        for index_near, index_ref in enumerate(indices):
-            for i, distance in enumerate(dist[index_near]):
-                if distance <= dist_cutoff:
-                    if not active_region_only:
-                        # Determine active site status
-                        if self.active_region is None:
-                            site_status = 'None'
-                        elif any(idx in [water_H_indices[index_near], water_O_indices[index_ref[i]]] for idx in [f.index for f in self.active_region]):
-                            site_status = 'active_region'
-                        else:
-                            site_status = 'not_active_region'
-                    else: 
-                        site_status = 'active_region'
-
-                    if water_H_indices[index_near] != water_O_indices[index_ref[i]]: #Check to make sure connection is not within the same water
-                        
-                        #Append connections
-                        if angle_criteria is None:
-                            if water_H_indices[index_near]<water_O_indices[index_ref[i]]:
-                                print('IMPORTANT CHANGE: TRYING NOT TO MAKE DUPLICATE CONNECTIONS')
-                                connections.append([water_H_indices[index_near],water_O_indices[index_ref[i]], water_H_names[index_near], 'WAT-WAT', site_status])
-
-                        else:
-                            water_hydrogen_coords = water_H_coords[index_near]
-                            water_o1_coords = water_O_coords[index_ref[i]]
-                            
-                            water_o2_coords = [water.O.coordinates for water in self.water_molecules if (water.O.index == water_H_indices[index_near])][0]
-                            water1 = water_hydrogen_coords - water_o1_coords
-                            water2 = water_hydrogen_coords - water_o2_coords
-
-                            cosine_angle = np.dot(water1, water2) / (np.linalg.norm(water2) * np.linalg.norm(water1))
-                            angle1 = np.degrees(np.arccos(cosine_angle))
-
-                            if angle1 >= angle_criteria and water_H_indices[index_near]<water_O_indices[index_ref[i]]:
-                                connections.append([water_H_indices[index_near],water_O_indices[index_ref[i]], water_H_names[index_near], 'WAT-WAT', site_status])
         return connections
 
     def generate_directed_network(self, msa_indexing=None, active_region_reference=None, active_region_COM=False, active_region_radius=8.0, 
@@ -699,36 +1056,30 @@ class WaterNetwork:
         #Only active site atoms in networks
         if active_region_only==True:
             #Add nodes
-            for molecule in water_active:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in water_active) #have nodes on all oxygens
 
             if water_only == False:
-                for molecule in protein_active:              
-                    MSA_index = MSA_indices[molecule.resid-1]
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in protein_active)
 
             #Add edges
             self.connections = self.find_directed_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only, angle_criteria=angle_criteria)
-            for connection in [f for f in self.connections if f[4]=='active_region']:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections if connection[4]=='active_region')
 
         #All atoms in network
         else:
             #Add nodes
-            for molecule in self.water_molecules:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in self.water_molecules) #have nodes on all oxygens
 
             if water_only == False:
                 #for molecule in self.protein_subset:
-                for molecule in self.protein_atoms:
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in self.protein_atoms)
             
             #Add edges
             self.connections = self.find_directed_connections(dist_cutoff=2.5, water_active=None, protein_active=None, active_region_only=False, water_only=water_only)
-            for connection in self.connections:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections)
 
         self.graph = G
+        self._build_adjacency(active_region_only)
         return G
 
 
@@ -776,39 +1127,122 @@ class WaterNetwork:
 
         #If desired, only include atoms in active site
         if active_region_only:
-            for molecule in water_active:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in water_active) #have nodes on all oxygens
 
             if water_only == False:
-                for molecule in protein_active:          
-                    MSA_index = MSA_indices[molecule.resid-1]
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in protein_active)
 
             self.connections = self.find_connections(dist_cutoff=max_connection_distance, water_active=water_active, protein_active=protein_active, active_region_only=active_region_only, water_only=water_only)
-            for connection in [f for f in self.connections if f[4]=='active_region']:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections if connection[4]=='active_region')
 
         #Include all atoms
         else:
-            for molecule in self.water_molecules:
-                G.add_node(molecule.O.index, pos=molecule.O.coordinates, atom_category='WAT', MSA=None) #have nodes on all oxygens
+            G.add_nodes_from((molecule.O.index, {'pos': molecule.O.coordinates, 'atom_category': 'WAT', 'MSA': None}) for molecule in self.water_molecules) #have nodes on all oxygens
 
             if water_only == False:
                 #for molecule in self.protein_subset:
-                for molecule in self.protein_atoms:
-                    MSA_index = MSA_indices[molecule.resid-1]
-                    G.add_node(molecule.index, pos=molecule.coordinates, atom_category='PROTEIN', MSA=MSA_index)
+                G.add_nodes_from((molecule.index, {'pos': molecule.coordinates, 'atom_category': 'PROTEIN', 'MSA': MSA_indices[molecule.resid-1]}) for molecule in self.protein_atoms)
             
             self.connections = self.find_connections(dist_cutoff=3.0, water_active=None, protein_active=None, active_region_only=False, water_only=water_only)
 
-            for connection in self.connections:
-                G.add_edge(connection[0], connection[1], connection_type=connection[3], active_region=connection[4])
+            G.add_edges_from((connection[0], connection[1], {'connection_type': connection[3], 'active_region': connection[4]}) for connection in self.connections)
 
         #Save as self.graph
         self.graph = G
+        self._build_adjacency(active_region_only)
 
         return self.graph
 
+    def _build_adjacency(self, active_region_only=False):
+        """
+        Store the edges of self.graph as a CSR adjacency matrix (self.adjacency_csr)
+
+        Parameters
+        ----------
+        active_region_only : bool, optional
+            If True, only connections within the active site are edges of the graph. Default is False.
+
+        Returns
+        ----------
+        None
+        """
+        if active_region_only:
+            connections = [f for f in self.connections if f[4]=='active_region']
+        else:
+            connections = self.connections
+
+        #Nodes are numbered in the order they appear in self.graph
+        self._node_ids = np.fromiter(self.graph.nodes, dtype=np.int64, count=self.graph.number_of_nodes())
+        node_order = np.argsort(self._node_ids)
+
+        edges = np.array([(f[0], f[1]) for f in connections], dtype=np.int64).reshape(-1,2)
+
+        #Repeated connections are one graph edge, holding the attributes of the last connection added
+        edge_keys = edges if self.graph.is_directed() else np.sort(edges, axis=1)
+        _, last = np.unique(edge_keys[::-1], axis=0, return_index=True)
+        keep = np.sort(len(edges) - 1 - last)
+
+        #Edge attributes as arrays parallel to the edge list, so selections are boolean masks
+        self._edge_list = node_order[np.searchsorted(self._node_ids, edges[keep], sorter=node_order)]
+        self._edge_status = np.array([f[4] for f in connections], dtype=str)[keep]
+        self._edge_type = np.array([f[3] for f in connections], dtype=str)[keep]
+        self.adjacency_csr = _edge_adjacency(self._edge_list, len(self._node_ids))
+        self._sub_cache.clear()
+
+    def _get_subgraph(self, selection='all'):
+        """
+        Get the whole graph or the subgraph of edges with a given active site status
+
+        Parameters
+        ----------
+        selection : {'all', 'active_region', 'not_active_region'}
+            Specifies which subset of the graph to analyze.
+
+        Returns
+        -------
+        networkx.Graph or networkx.DiGraph
+            Selected graph
+        """
+        if selection == 'all':
+            return self.graph
+
+        #Graphs assigned directly to self.graph have no edge arrays yet
+        if self.adjacency_csr is None:
+            self._build_adjacency()
+
+        if ('graph', selection) not in self._sub_cache:
+            #Select edges with a mask over the stored edge statuses
+            edges = self._node_ids[self._edge_list[self._edge_status == selection]]
+            self._sub_cache[('graph', selection)] = self.graph.edge_subgraph(list(zip(edges[:,0].tolist(), edges[:,1].tolist())))
+        return self._sub_cache[('graph', selection)]
+
+    def _selected_adjacency(self, selection='all'):
+        """
+        Get the adjacency matrix of the whole graph or of the edges with a given active site status
+
+        Parameters
+        ----------
+        selection : {'all', 'active_region', 'not_active_region'}
+            Specifies which subset of the graph to analyze.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Adjacency matrix. For a subset, only nodes touched by the selected edges are kept.
+        """
+        #Graphs assigned directly to self.graph have no adjacency matrix yet
+        if self.adjacency_csr is None:
+            self._build_adjacency()
+
+        if selection == 'all':
+            return self.adjacency_csr
+
+        if ('adjacency', selection) not in self._sub_cache:
+            edges = self._edge_list[self._edge_status == selection]
+            nodes, inverse = np.unique(edges, return_inverse=True)
+            self._sub_cache[('adjacency', selection)] = _edge_adjacency(inverse.reshape(-1,2), len(nodes))
+        return self._sub_cache[('adjacency', selection)]
+
     def get_density(self, selection='all'):
         """
         Calculate the density of the graph.
@@ -832,10 +1266,7 @@ class WaterNetwork:
         """
 
         #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in S.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
 
         #Calculate density for subgraph
         nedges = S.number_of_edges()
@@ -850,8 +1281,7 @@ class WaterNetwork:
         """
         Compute the connected components of the graph.
 
-        Requires `self.graph` to exist. Uses `weakly_connected_components` if the graph is directed, 
-        and `connected_components` if the graph is undirected.
+        Requires `self.adjacency_csr` to exist. Uses weak connectivity if the graph is directed.
 
         Parameters
         ----------
@@ -863,26 +1293,13 @@ class WaterNetwork:
         numpy.ndarray
             An array of connected components in the selected network.
         """
-        #Initiate empty array for connected components
-        components = []
-
-        #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        adjacency = self._selected_adjacency(selection)
 
-        #Use weakly_connected_components for directed graph
-        if self.graph.is_directed():
-            for val in [len(cc) for cc in nx.weakly_connected_components(S)]:
-                components.append(val)
-        #Use connected_components for undirected
-        else:
-            for val in [len(cc) for cc in nx.connected_components(S)]:
-                components.append(val)
+        #Weakly connected components for directed graphs, connected components for undirected
+        n_components, labels = csgraph.connected_components(adjacency, directed=self.graph.is_directed(), connection='weak')
 
         #Reshape components to make plotting easier
-        components = np.array(components).reshape(-1,1)
+        components = np.bincount(labels, minlength=n_components).reshape(-1,1)
         return components
     
     def get_interactions(self, selection='all'):
@@ -941,31 +1358,26 @@ class WaterNetwork:
         float
             The average characteristic path length of the selected network.
         """
-        #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
-
-        try:
-            CPL = nx.average_shortest_path_length(S)
-        except: #average_shortest_path_length will fail if graph is not connected
-            if S.is_directed():
+        adjacency = self._selected_adjacency(selection)
+        directed = self.graph.is_directed()
 
-                #Change to undirected graph for nx.average_shortest_path_length
-                S = S.to_undirected() 
+        #Average over the whole graph only if every node can reach every other node
+        n_components, labels = csgraph.connected_components(adjacency, directed=directed, connection='strong')
+        if n_components == 1:
+            CPL = _average_path_length(adjacency, directed=directed)
+        else:
+            #Otherwise average over the connected components of the undirected graph
+            n_components, labels = csgraph.connected_components(adjacency, directed=False)
+            sizes = np.bincount(labels, minlength=n_components)
+            members = np.split(np.argsort(labels, kind='stable'), np.cumsum(sizes)[:-1])
 
             if exclude_single_points:
-                cc = [f for f in nx.connected_components(S) if len(f)>1]
+                cc = np.flatnonzero(sizes > 1)
             else:
-                cc = [f for f in nx.connected_components(S)]
-
-            CPLs = []
-            for C in (S.subgraph(c).copy() for c in cc):
-                try:
-                    CPLs.append(nx.average_shortest_path_length(C))
-                except nx.NetworkXPointlessConcept:
-                    continue
+                cc = np.arange(n_components)
+
+            CPLs = [_average_path_length(adjacency[members[c]][:, members[c]]) for c in cc]
+
             #Average over all calculated CPLs
             CPL = np.array(CPLs).mean()
             
@@ -988,45 +1400,35 @@ class WaterNetwork:
         float
             The computed graph entropy.
         """
-        def degree_distribuiton(G):
-            vk = dict(G.degree())
-            vk = list(vk.values())
-
-            maxk = np.max(vk)
-            mink = np.min(vk)
-
-            kvalues = np.arange(0, maxk+1)
-
-            Pk = np.zeros(maxk+1)
-            for k in vk:
-                Pk[k] = Pk[k] + 1
-
-            Pk = Pk/sum(Pk)
-            return kvalues, Pk
-        
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
 
-        k, Pk = degree_distribuiton(S)
+        #Degree distribution of the selected graph
+        vk = np.fromiter((d for _, d in S.degree()), dtype=np.int64, count=S.number_of_nodes())
+        counts = np.bincount(vk)
+        Pk = counts/counts.sum()
 
-        H = 0
-        for p in Pk:
-            if p > 0:
-                H = H - p*np.log2(p)
+        Pk = Pk[Pk > 0]
+        H = float(-(Pk*np.log2(Pk)).sum())
 
         return H
     
-    def get_clustering_coefficient(self, selection='all'):
+    def get_clustering_coefficient(self, selection='all', backend=None):
 
         #Choose all subgraphs under particular criteria
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
+
+        #Selections without nodes (e.g. no waters in the active region) have no coefficients
+        if S.number_of_nodes() == 0:
+            return {}
+
+        #Directed graphs and dispatch backends go through networkx
+        if S.is_directed() or backend is not None:
+            kwargs = {} if backend is None else {'backend': backend}
+            return nx.clustering(S, **kwargs)
 
-        CC_dict = nx.clustering(S)
+        nodes = list(S)
+        CC = _clustering_coefficients(nx.to_scipy_sparse_array(S, nodelist=nodes, weight=None, format='csr'))
+        CC_dict = dict(zip(nodes, CC.tolist()))
         return CC_dict
     
     def get_all_coordinates(self, selection='all', water_only=True):
@@ -1044,28 +1446,31 @@ class WaterNetwork:
         Returns
         -------
         numpy.ndarray
-            An array of coordinates for the selected atoms.
+            (N,3) float32 array of coordinates for the selected atoms.
         """
+        if not self._soa_ready:
+            self._assemble_soa()
+
         #Choose all subgraphs under particular criteria
         if selection=='all':
-            #Find all coordinates
-            coords = [np.array(f.O.coordinates) for f in self.water_molecules]
-
-            if not water_only:
-                #coords.extend([np.array(f.coordinates) for f in self.protein_subset])
-                coords.extend([np.array(f.coordinates) for f in self.protein_atoms])
+            water_rows = slice(None)
+            protein_rows = slice(None)
 
         else:
-            #Find all coordinates
-            coords = [np.array(f.O.coordinates) for f in self.active_region if type(f)==WaterMolecule]
+            #Rows of the active site atoms in the stacked arrays
+            active_indices = [f.O.index if type(f)==WaterMolecule else f.index for f in self.active_region]
+            water_rows = np.isin(self._wat_O_idx, active_indices)
+            protein_rows = np.isin(self._prot_idx, active_indices)
 
-            if not water_only:
-                coords.extend([np.array(f.coordinates) for f in self.active_region if type(f)==OtherAtom])
+        #Find all coordinates
+        coords = [self._wat_O_xyz[water_rows]]
 
+        if not water_only:
+            coords.append(self._prot_xyz[protein_rows])
 
-        return coords
+        return np.concatenate(coords)
 
-    def get_shortest_path(self, selection='all', source=None, target=None):
+    def get_shortest_path(self, selection='all', source=None, target=None, backend=None):
         """
         Calculate the shortest path for a given network
 
@@ -1077,6 +1482,8 @@ class WaterNetwork:
             Source node to initialize path
         target : int, optional
             Target node to terminate path
+        backend : str, optional
+            NetworkX dispatch backend to run on (e.g. 'cugraph' or 'parallel'), if installed. Default is None.
 
         Returns
         -------
@@ -1088,12 +1495,11 @@ class WaterNetwork:
         ----
         Node indexes are equivalent to MDAnalysis 0-based atom indexing (Add 1 to your pdb atom numbering!)
         """
-        if selection=='all':
-            S = self.graph
-        else:
-            S = self.graph.edge_subgraph([(edge1, edge2) for (edge1,edge2, data) in self.graph.edges(data=True) if data['active_region']==selection])
+        S = self._get_subgraph(selection)
 
-        shortest_path = nx.shortest_path(S, source, target)
+        #Only pass a backend when one is requested, so older NetworkX versions are unaffected
+        kwargs = {} if backend is None else {'backend': backend}
+        shortest_path = nx.shortest_path(S, source, target, **kwargs)
         return shortest_path
 
 
@@ -1163,7 +1569,7 @@ def extract_objects(pdb_file, network_type, custom_selection, active_region_refe
 
     #Initiate active site reference atomgroup
     if active_region_reference is not None:
-        active_region_residue = u.select_atoms(active_region_reference, updating=True)
+        active_region_residue = u.select_atoms(active_region_reference)
     else:
         active_region_residue = None
 
@@ -1174,12 +1580,11 @@ def extract_objects(pdb_file, network_type, custom_selection, active_region_refe
     if network_type == 'water-protein':
         water_only = False
         #Add protein atoms to network
-        for i, atm in enumerate(ag_protein.atoms):
-            try:
-                msa_resid = msa_indexing[atm.resid-1] #CHECK THIS 
-            except:
-                msa_resid = None
-            water_network.add_atom(atm.index, atm.name, atm.resname, *atm.position, atm.resid, msa_resid)
+        #Read atom attributes as arrays once rather than through each Atom object
+        msa_resids = _msa_lookup(msa_indexing, ag_protein.resids)
+        for index, name, resname, position, resid, msa_resid in zip(ag_protein.indices.tolist(), ag_protein.names, ag_protein.resnames, 
+                                                                   ag_protein.positions, ag_protein.resids.tolist(), msa_resids):
+            water_network.add_atom(index, name, resname, *position, resid, msa_resid)
     elif network_type == 'water-water':
         water_only = True
     else:
@@ -1242,7 +1647,7 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
                        analysis_conditions='all', analysis_selection='all', project_networks=False, return_network=True,
                        cluster_coordinates=False, clustering_method='hdbscan', cluster_water_only=True, min_cluster_samples=15, eps=None, msa_indexing=True,
                        alignment_file='alignment.txt', combined_fasta='all_seqs.fa', fasta_directory='fasta', classify_water=True, classification_file_base='STATIC',
-                       MSA_reference_pdb=None, water_reference_resids=None, num_workers=4, shortest_path_nodes=None):
+                       MSA_reference_pdb=None, water_reference_resids=None, num_workers=4, shortest_path_nodes=None, backend=None):
                        
     """
     Initialize and compute all water networks for a directory of pdbs.
@@ -1316,6 +1721,8 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
         Number of CPU cores to use for parallel computation. Default is 4.
     shortest_path_nodes : list, optional
         List of tuples of nodes to perform shortest path analysis among. Default is None (shortest path among entire network will be returned)
+    backend : str or None, optional
+        NetworkX dispatch backend (e.g. 'cugraph' or 'parallel') used for clustering coefficients and shortest paths, if installed. Default is None.
 
 
     Returns
@@ -1432,34 +1839,27 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
 
             classification_dict = residue_analysis.classify_waters(network, ref1_coords=ref_coords[0], ref2_coords=ref2_coords)
 
-            #Write classification dict into a csv file -- CHANGE THIS FOR TRAJECTORIES
-            with open(f'msa_classification/{classification_file_base}.csv', 'a') as FILE:
-                for key, val in classification_dict.items():
-                    FILE.write(f"{pdb_file.split('.')[0]},{key},{val[0]},{val[1]}\n")
+            #Rows of the classification csv file are written by the parent process
+            classification_rows = ''.join([f"{pdb_file.split('.')[0]},{key},{val[0]},{val[1]}\n" for key, val in classification_dict.items()])
         
         metrics = {}
+        if classify_water:
+            metrics['classification_rows'] = classification_rows
+
         #Calculate metrics as per user input
-        if analysis_conditions['density'] == 'on':
-            metrics['density'] = network.get_density(selection=analysis_selection)
-        if analysis_conditions['connected_components'] == 'on':
-            metrics['connected_components'] = network.get_connected_components(selection=analysis_selection)
-        if analysis_conditions['interaction_counts'] == 'on':
-            metrics['interaction_counts'] = network.get_interactions()
-        if analysis_conditions['per_residue_interactions'] == 'on':
-            metrics['per_residue_interaction'] = network.get_per_residue_interactions(selection=analysis_selection)
-        if analysis_conditions['characteristic_path_length'] == 'on':
-            metrics['characteristic_path_length'] = network.get_CPL(selection=analysis_selection)
-        if analysis_conditions['graph_entropy'] == 'on':
-            metrics['entropy'] = network.get_entropy(selection=analysis_selection)
-        if analysis_conditions['clustering_coefficient'] == 'on':
-            metrics['clustering_coefficient'] = network.get_clustering_coefficient(selection=analysis_selection)
+        for key, method, uses_selection, uses_backend in enabled_metrics:
+            kwargs = {'backend': backend} if uses_backend else {}
+            if uses_selection:
+                metrics[key] = getattr(network, method)(selection=analysis_selection, **kwargs)
+            else:
+                metrics[key] = getattr(network, method)(**kwargs)
 
         if shortest_path_nodes is None:
-            metrics['shortest_path'] = network.get_shortest_path(selection=analysis_selection)
+            metrics['shortest_path'] = network.get_shortest_path(selection=analysis_selection, backend=backend)
         else:
             metrics['shortest_path'] = []
             for (source, target) in shortest_path_nodes:
-                metrics['shortest_path'].append(network.get_shortest_path(selection=analysis_conditions, source=source, target=target))
+                metrics['shortest_path'].append(network.get_shortest_path(selection=analysis_conditions, source=source, target=target, backend=backend))
 
         #clustering coefficient -- https://www.annualreviews.org/content/journals/10.1146/annurev-physchem-050317-020915
 
@@ -1470,8 +1870,7 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
             else:
                 selection='all'
             #coords.append(network.get_all_coordinates(selection=selection))
-            coords = network.get_all_coordinates(selection=selection, water_only=cluster_water_only)
-            metrics['coordinates'] = np.array(coords).reshape(-1,3)
+            metrics['coordinates'] = network.get_all_coordinates(selection=selection, water_only=cluster_water_only)
 
         #Create pymol projections for each pdb
         if project_networks:
@@ -1499,8 +1898,12 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
             'shortest_path': 'on'
         }
 
+    #Metrics switched on in analysis_conditions, resolved once for all structures
+    enabled_metrics = [_METHOD[key] for key, val in analysis_conditions.items() if key in _METHOD and val == 'on']
+
 
     ref_coords = [None]
+    references = None
     if active_region_reference is not None:
         if MSA_reference_pdb is not None:
             u = mda.Universe(os.path.join(pdb_dir, MSA_reference_pdb))
@@ -1534,6 +1937,11 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
     results = Parallel(n_jobs=num_workers)(delayed(process_pdb)(pdb_file, coords, ref_coords, references) for pdb_file in pdbs)
     metrics, networks = zip(*results)
 
+    #Write classification dict of every pdb into a csv file, in pdb order
+    if classify_water:
+        with open(f'msa_classification/{classification_file_base}.csv', 'a') as FILE:
+            FILE.write(''.join([f.pop('classification_rows', '') for f in metrics]))
+
     print('obtained metrics and networks')
     if cluster_coordinates:
         print('Clustering...')
@@ -1542,8 +1950,8 @@ def initialize_network(structure_directory, topology_file=None, trajectory_file=
             f['coordinates'] for f in metrics if f['coordinates'].shape[1] == 3
         ]
 
-        # Transpose each (3, x) array to (x, 3) and concatenate along axis 0
-        combined_coordinates = np.concatenate([arr for arr in coordinates], axis=0)
+        #Copy into one pre-sized array
+        combined_coordinates = _combine_coordinates(coordinates)
         cluster_centers = get_clusters(networks, cluster=clustering_method, min_samples=min_cluster_samples, coordinates=combined_coordinates, eps=eps, filename_base=classification_file_base)
         return (metrics, networks, cluster_centers, names)
 
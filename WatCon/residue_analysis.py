@@ -26,19 +26,17 @@ def get_interaction_counts(network, selection='all'):
     dict
         Describes number of 'water-water' and 'water-protein' interactions.
     """
-    interaction_counts = {'water-water': 0, 'water-protein': 0}
-    for _, _, data in network.graph.edges(data=True):
-        if selection=='all':
-            if data['connection_type']=='WAT-PROT':
-                interaction_counts['water-protein'] += 1
-            else:
-                interaction_counts['water-water'] += 1
-        else:
-            if data['active_region'] == selection:
-                if data['connection_type']=='WAT-PROT':
-                    interaction_counts['water-protein'] += 1
-                else:
-                    interaction_counts['water-water'] += 1
+    #Edge attributes are stored as arrays when the graph is generated
+    if network.adjacency_csr is None:
+        network._build_adjacency()
+
+    if selection=='all':
+        edge_types = network._edge_type
+    else:
+        edge_types = network._edge_type[network._edge_status == selection]
+
+    n_protein = int(np.count_nonzero(edge_types == 'WAT-PROT'))
+    interaction_counts = {'water-water': len(edge_types) - n_protein, 'water-protein': n_protein}
     return interaction_counts
 
 
@@ -178,9 +176,9 @@ def classify_waters(network, ref1_coords, ref2_coords):
         v1 = np.array([prot_coords[0]-wat_coords[0], prot_coords[1]-wat_coords[1], prot_coords[2]-wat_coords[2]])
         v2 = np.array([ref_coords[0]-wat_coords[0], ref_coords[1]-wat_coords[1], ref_coords[2]-wat_coords[2]])
 
-        mag_v1 = np.sqrt((v1[0]**2+v1[1]**2+v1[2]**2))
-        mag_v2 = np.sqrt((v2[0]**2+v2[1]**2+v2[2]**2))
-        angle = (180/np.pi) * np.arccos(np.dot(v1, v2)/(mag_v1*mag_v2))
+        mag2_v1 = v1[0]**2+v1[1]**2+v1[2]**2
+        mag2_v2 = v2[0]**2+v2[1]**2+v2[2]**2
+        angle = (180/np.pi) * np.arccos(np.clip(np.dot(v1, v2)/np.sqrt(mag2_v1*mag2_v2), -1, 1))
         return angle
 
     classification_dict = {}
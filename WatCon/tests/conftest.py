@@ -0,0 +1,55 @@
+"""
+Shared helpers for writing small test systems.
+"""
+
+import numpy as np
+import MDAnalysis as mda
+
+
+def water_residue(O):
+    """Atoms of a water molecule with its oxygen at O"""
+    O = np.asarray(O, dtype=float)
+    return ('HOH', [('O', O), ('H1', O + [0.96, 0.0, 0.0]), ('H2', O + [-0.24, 0.93, 0.0])])
+
+
+def residues_from_positions(resnames, atom_names, positions):
+    """Residues for write_structure from residue names, the atom names of each residue and one (N,3) array of positions"""
+    sizes = [len(names) for names in atom_names]
+    residue_positions = np.split(np.asarray(positions), np.cumsum(sizes)[:-1])
+    return [(resname, list(zip(names, xyz))) for resname, names, xyz in zip(resnames, atom_names, residue_positions)]
+
+
+def write_structure(filename, residues, box=None, trajectory_file=None, frames=None):
+    """
+    Write residues, given as (resname, [(atom name, position), ...]), to a PDB file
+
+    If trajectory_file is given, every (N,3) array of positions in frames is also written to it as one frame
+    """
+    n_atoms = sum(len(atoms) for _, atoms in residues)
+    resindex = np.repeat(np.arange(len(residues)), [len(atoms) for _, atoms in residues])
+    u = mda.Universe.empty(n_atoms, n_residues=len(residues), atom_resindex=resindex, trajectory=True)
+    names = [name for _, atoms in residues for name, _ in atoms]
+    u.add_TopologyAttr('name', names)
+    u.add_TopologyAttr('type', [name[0] for name in names])
+    u.add_TopologyAttr('resname', [resname for resname, _ in residues])
+    u.add_TopologyAttr('resid', np.arange(1, len(residues)+1))
+    u.add_TopologyAttr('chainID', ['A']*n_atoms)
+    u.atoms.positions = np.array([position for _, atoms in residues for _, position in atoms], dtype=np.float32)
+    if box is not None:
+        u.dimensions = box
+    u.atoms.write(filename)
+
+    if trajectory_file is not None:
+        with mda.Writer(trajectory_file, n_atoms) as W:
+            for positions in frames:
+                u.atoms.positions = positions
+                W.write(u.atoms)
+    return filename
+
+
+def icosahedron(center, radius):
+    """Vertices of an icosahedron -- 12 points around center, each 1.05*radius from its 5 closest neighbors"""
+    phi = (1 + np.sqrt(5)) / 2
+    vertices = np.array([[0, s1, s2*phi] for s1 in (-1, 1) for s2 in (-1, 1)], dtype=float)
+    vertices = np.concatenate([vertices, np.roll(vertices, 1, axis=1), np.roll(vertices, 2, axis=1)])
+    return np.asarray(center) + radius * vertices / np.linalg.norm(vertices[0])
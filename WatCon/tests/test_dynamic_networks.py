@@ -0,0 +1,286 @@
+"""
+Regression tests for water networks built from trajectories (periodic boundary conditions).
+"""
+
+import os
+
+import numpy as np
+import pytest
+import MDAnalysis as mda
+
+import WatCon.generate_dynamic_networks as dynamic
+from WatCon.tests.conftest import water_residue, residues_from_positions, write_structure, icosahedron
+
+
+BOX = 14.0
+CUTOFF = 3.0
+
+
+def _minimum_image_distances(a, b, box):
+    """Brute-force minimum image distances in an orthorhombic box"""
+    delta = a[:, None, :] - b[None, :, :]
+    delta -= box * np.round(delta / box)
+    return np.sqrt((delta**2).sum(axis=-1))
+
+
+@pytest.fixture
+def water_box(tmp_path):
+    """Write a periodic box of randomly placed waters as a PDB topology and a 3 frame DCD trajectory"""
+    rng = np.random.default_rng(2024)
+    n_waters = 60
+
+    frames = []
+    for _ in range(3):
+        O = rng.uniform(0, BOX, (n_waters, 3))
+        H1 = O + 0.96*np.array([1.0, 0.0, 0.0])
+        H2 = O + 0.96*np.array([-0.25, 0.97, 0.0])
+        frames.append(np.stack([O, H1, H2], axis=1).reshape(-1, 3).astype(np.float32))
+
+    pdb_file, dcd_file = str(tmp_path / 'water.pdb'), str(tmp_path / 'water.dcd')
+    residues = residues_from_positions(['HOH']*n_waters, [['O', 'H1', 'H2']]*n_waters, frames[0])
+    write_structure(pdb_file, residues, box=[BOX, BOX, BOX, 90, 90, 90], trajectory_file=dcd_file, frames=frames)
+
+    yield pdb_file, dcd_file
+    dynamic.clear_trajectory_caches()
+
+
+@pytest.fixture
+def protein_box(tmp_path):
+    """Write a short serine peptide in a periodic box of randomly placed waters, with 3 frames in which everything moves"""
+    rng = np.random.default_rng(7)
+    residue_names = ['N', 'H', 'CA', 'HA', 'CB', 'OG', 'HG', 'C', 'O']
+    residue_offsets = np.array([[0.0, 0.0, 0.0], [-0.5, 0.9, 0.0], [1.2, -0.5, 0.0], [1.3, -1.5, 0.3], [1.5, 0.2, 1.3],
+                                [2.9, 0.1, 1.5], [3.2, 0.7, 2.2], [2.4, -0.3, -1.0], [2.6, 0.5, -1.9]])
+    n_residues, n_waters = 4, 150
+    box = 24.0
+
+    protein = np.concatenate([residue_offsets + [6.0 + 3.8*k, 11.0, 12.0] for k in range(n_residues)])
+    frames = []
+    for _ in range(3):
+        O = rng.uniform(0, box, (n_waters, 3))
+        waters = np.stack([O, O + [0.96, 0.0, 0.0], O + [-0.25, 0.93, 0.0]], axis=1).reshape(-1, 3)
+        frames.append(np.concatenate([protein + rng.normal(0, 0.3, protein.shape), waters]).astype(np.float32))
+
+    pdb_file, dcd_file = str(tmp_path / 'protein.pdb'), str(tmp_path / 'protein.dcd')
+    residues = residues_from_positions(['SER']*n_residues + ['HOH']*n_waters, 
+                                       [residue_names]*n_residues + [['O', 'H1', 'H2']]*n_waters, frames[0])
+    write_structure(pdb_file, residues, box=[box, box, box, 90, 90, 90], trajectory_file=dcd_file, frames=frames)
+
+    yield pdb_file, dcd_file
+    dynamic.clear_trajectory_caches()
+
+
+def _expected_water_edges(u):
+    """Pairs of water oxygen indices within CUTOFF under the minimum image convention"""
+    oxygens = u.select_atoms('name O')
+    dist = _minimum_image_distances(oxygens.positions.astype(np.float64), oxygens.positions.astype(np.float64), BOX)
+    i, j = np.nonzero(np.triu(dist <= CUTOFF, k=1))
+    return {frozenset(pair) for pair in zip(oxygens.indices[i].tolist(), oxygens.indices[j].tolist())}
+
+
+def test_oxygen_network_periodic_pairs(water_box):
+    pdb_file, dcd_file = water_box
+    u = mda.Universe(pdb_file, dcd_file)
+
+    crossing = 0
+    for frame_idx in range(len(u.trajectory)):
+        network = dynamic.extract_objects_per_frame(pdb_file, dcd_file, frame_idx, 'water-water', None, None, False, 8.0,
+                                                    None, None, max_connection_distance=CUTOFF)
+        u.trajectory[frame_idx]
+        expected = _expected_water_edges(u)
+        found = {frozenset(conn[:2]) for conn in network.connections}
+
+        assert found == expected
+        assert all(conn[3] == 'WAT-WAT' for conn in network.connections)
+
+        #Make sure some pairs are only connected through the periodic boundary
+        positions = {atm.index: atm.position for atm in u.select_atoms('name O')}
+        crossing += sum(np.linalg.norm(positions[a] - positions[b]) > CUTOFF for a, b in map(tuple, expected))
+    assert crossing > 0
+
+
+def test_directed_network_periodic_pairs(water_box):
+    pdb_file, dcd_file = water_box
+    u = mda.Universe(pdb_file, dcd_file)
+    network = dynamic.extract_objects_per_frame(pdb_file, dcd_file, 1, 'water-water', None, None, False, 8.0,
+                                                None, None, directed=True, max_connection_distance=2.5)
+    u.trajectory[1]
+
+    oxygens = u.select_atoms('name O')
+    hydrogens = u.select_atoms('name H1 or name H2')
+    dist = _minimum_image_distances(hydrogens.positions.astype(np.float64), oxygens.positions.astype(np.float64), BOX)
+    i, j = np.nonzero(dist <= 2.5)
+
+    #Hydrogens are labelled with the index of their own oxygen, and a hydrogen is never connected to its own oxygen
+    expected = {(hydrogens[a].residue.atoms[0].index, hydrogens[a].name, oxygens[b].index) for a, b in zip(i, j)
+                if hydrogens[a].resid != oxygens[b].resid}
+    found = {(conn[0], conn[2], conn[1]) for conn in network.connections}
+    assert found == expected
+    assert network.graph.is_directed()
+
+
+def test_initialize_network_over_trajectory(water_box):
+    pdb_file, dcd_file = water_box
+    metrics, networks, centers = dynamic.initialize_network(pdb_file, dcd_file, network_type='water-water', msa_indexing=False,
+                                                            max_distance=CUTOFF, num_workers=1, return_network=True)
+    u = mda.Universe(pdb_file, dcd_file)
+    assert len(metrics) == len(networks) == len(u.trajectory)
+    for frame_idx, network in enumerate(networks):
+        u.trajectory[frame_idx]
+        assert {frozenset(conn[:2]) for conn in network.connections} == _expected_water_edges(u)
+
+
+def test_build_networks_over_trajectory(water_box):
+    pdb_file, dcd_file = water_box
+    u = mda.Universe(pdb_file, dcd_file)
+    networks = dynamic.build_networks_over_trajectory(u, network_type='water-water', n_jobs=1, max_connection_distance=CUTOFF)
+    assert len(networks) == len(u.trajectory)
+    for frame_idx, network in enumerate(networks):
+        u.trajectory[frame_idx]
+        assert {frozenset(conn[:2]) for conn in network.connections} == _expected_water_edges(u)
+
+
+def test_protein_radius_is_exact(protein_box):
+    pdb_file, dcd_file = protein_box
+    u = mda.Universe(pdb_file, dcd_file)
+    protein = u.select_atoms('protein')
+    expected = np.linalg.norm(protein.positions - protein.center_of_mass(), axis=1).max()
+
+    max_distance = dynamic._get_frame_selections(pdb_file, dcd_file, None, None, False)[-1]
+    assert max_distance == pytest.approx(expected, rel=1e-5)
+
+
+def test_protein_sphere_matches_sphzone(protein_box):
+    pdb_file, dcd_file = protein_box
+    u = mda.Universe(pdb_file, dcd_file)
+    protein = u.select_atoms('protein')
+    radius = np.linalg.norm(protein.positions - protein.center_of_mass(), axis=1).max() + 0.5
+    sphzone = u.select_atoms(f'resname HOH and sphzone {radius} protein', updating=True)
+
+    for frame_idx in range(len(u.trajectory)):
+        network = dynamic.extract_objects_per_frame(pdb_file, dcd_file, frame_idx, 'water-protein', None, None, False, 8.0,
+                                                    None, None, max_connection_distance=CUTOFF)
+        u.trajectory[frame_idx]
+        assert {mol.resid for mol in network.water_molecules} == set(sphzone.resids.tolist())
+
+
+def test_rewritten_trajectory_is_reopened(water_box, tmp_path):
+    pdb_file, dcd_file = water_box
+    first = dynamic.extract_objects_per_frame(pdb_file, dcd_file, 0, 'water-water', None, None, False, 8.0,
+                                              None, None, max_connection_distance=CUTOFF)
+
+    #Rewrite the trajectory in place with every atom shifted
+    u = mda.Universe(pdb_file, dcd_file)
+    shifted = str(tmp_path / 'shifted.dcd')
+    with mda.Writer(shifted, u.atoms.n_atoms) as W:
+        for ts in u.trajectory:
+            u.atoms.translate([1.0, 0.0, 0.0])
+            W.write(u.atoms)
+    u.trajectory.close()
+    with open(shifted, 'rb') as src, open(dcd_file, 'wb') as dst:
+        dst.write(src.read())
+    os.utime(dcd_file, ns=(0, 0))
+
+    second = dynamic.extract_objects_per_frame(pdb_file, dcd_file, 0, 'water-water', None, None, False, 8.0,
+                                               None, None, max_connection_distance=CUTOFF)
+    assert np.allclose(second._wat_O_xyz, first._wat_O_xyz + [1.0, 0.0, 0.0], atol=1e-3)
+    assert len(dynamic._UNIVERSE_CACHE) == 1
+
+    dynamic.clear_trajectory_caches()
+    assert not dynamic._UNIVERSE_CACHE and not dynamic._SELECTION_CACHE
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_build_networks_matches_extract_objects(protein_box, directed):
+    pdb_file, dcd_file = protein_box
+    cutoff = 2.5 if directed else CUTOFF
+    u = mda.Universe(pdb_file, dcd_file)
+    networks = dynamic.build_networks_over_trajectory(u, directed=directed, n_jobs=2, frames_per_task=2, max_connection_distance=cutoff)
+
+    assert len(networks) == len(u.trajectory)
+    for frame_idx, network in enumerate(networks):
+        expected = dynamic.extract_objects_per_frame(pdb_file, dcd_file, frame_idx, 'water-protein', None, None, False, 8.0,
+                                                     None, None, directed=directed, max_connection_distance=cutoff)
+        assert network.connections == expected.connections
+        assert set(network.graph.nodes) == set(expected.graph.nodes)
+        assert any(conn[3] == 'WAT-PROT' for conn in network.connections)
+
+
+def test_build_networks_rejects_active_region(protein_box):
+    pdb_file, dcd_file = protein_box
+    u = mda.Universe(pdb_file, dcd_file)
+    with pytest.raises(ValueError):
+        dynamic.build_networks_over_trajectory(u, n_jobs=1, active_region_reference='resid 2')
+
+
+def test_dense_waters_across_boundary(tmp_path):
+    #12 waters around a water in the corner of the box, so most neighbors are periodic images
+    waters = [water_residue(O) for O in [[0.5, 0.5, 0.5], *(icosahedron([0.5, 0.5, 0.5], 2.8) % BOX)]]
+    pdb_file = write_structure(str(tmp_path / 'corner.pdb'), waters, box=[BOX, BOX, BOX, 90, 90, 90])
+
+    network = dynamic.extract_objects_per_frame(pdb_file, pdb_file, 0, 'water-water', None, None, False, 8.0,
+                                                None, None, max_connection_distance=CUTOFF)
+    u = mda.Universe(pdb_file)
+    assert {frozenset(conn[:2]) for conn in network.connections} == _expected_water_edges(u)
+    assert sum(0 in conn[:2] for conn in network.connections) == 12
+    dynamic.clear_trajectory_caches()
+
+
+def test_directed_angle_criteria_across_boundary(tmp_path):
+    #H1 of the first water points across the boundary straight at the second oxygen, H1 of the second water is bent away
+    donor = ('HOH', [('O', np.array([1.0, 5.0, 5.0])), ('H1', np.array([0.04, 5.0, 5.0])), ('H2', np.array([1.24, 5.93, 5.0]))])
+    acceptor = ('HOH', [('O', np.array([BOX-1.8, 5.0, 5.0])), ('H1', np.array([BOX-1.8, 5.96, 5.0])), ('H2', np.array([BOX-2.7, 4.7, 5.0]))])
+    pdb_file = write_structure(str(tmp_path / 'pair.pdb'), [donor, acceptor], box=[BOX, BOX, BOX, 90, 90, 90])
+
+    network = dynamic.extract_objects_per_frame(pdb_file, pdb_file, 0, 'water-water', None, None, False, 8.0,
+                                                None, None, directed=True, max_connection_distance=CUTOFF)
+    box = mda.Universe(pdb_file).dimensions
+    assert {conn[:3] for conn in network.find_directed_connections(dist_cutoff=CUTOFF, water_only=True, box=box)} == {(0, 3, 'H1'), (3, 0, 'H1')}
+
+    #Angles at the donor hydrogens are 180 and 71 degrees once both bond vectors are wrapped
+    assert {conn[:3] for conn in network.find_directed_connections(dist_cutoff=CUTOFF, water_only=True, angle_criteria=120, box=box)} == {(0, 3, 'H1')}
+    dynamic.clear_trajectory_caches()
+
+
+def test_bounding_box_culls_around_single_point():
+    rng = np.random.default_rng(11)
+    box = np.array([30.0, 30.0, 30.0, 90, 90, 90], dtype=np.float32)
+    coordinates = rng.uniform(0, 30.0, (2000, 3)).astype(np.float32)
+    center = np.array([29.0, 15.0, 2.0], dtype=np.float32)
+
+    mask = dynamic._bounding_box_mask(coordinates, center, 5.0, box=box)
+    within = _minimum_image_distances(coordinates, center[None, :], 30.0)[:, 0] <= 5.0
+    assert np.all(mask[within])
+    assert mask.sum() < 0.1*len(coordinates)
+    assert np.array_equal(mask, dynamic._bounding_box_mask(coordinates, center[None, :], 5.0, box=box))
+
+
+def test_active_region_around_center_of_mass(protein_box):
+    pdb_file, dcd_file = protein_box
+    u = mda.Universe(pdb_file, dcd_file)
+    radius = 6.0
+    for frame_idx in range(len(u.trajectory)):
+        network = dynamic.extract_objects_per_frame(pdb_file, dcd_file, frame_idx, 'water-protein', None, 'resid 2', True, radius,
+                                                    None, None, max_connection_distance=CUTOFF)
+        u.trajectory[frame_idx]
+        center = u.select_atoms('resid 2').center_of_mass()[None, :]
+
+        #A water is in the active region if any of its atoms is within the radius of the center of mass
+        expected = {mol.O.index for mol in network.water_molecules
+                    if _minimum_image_distances(np.array([mol.O.coordinates, mol.H1.coordinates, mol.H2.coordinates]), center, 24.0).min() <= radius}
+        active = {atm.O.index for atm in network.active_region if isinstance(atm, dynamic.WaterMolecule)}
+        assert active == expected
+        assert 0 < len(active) < len(network.water_molecules)
+
+
+def test_initialize_network_passes_backend(water_box):
+    pdb_file, dcd_file = water_box
+    kwargs = dict(network_type='water-water', msa_indexing=False, max_distance=CUTOFF, num_workers=1)
+    default = dynamic.initialize_network(pdb_file, dcd_file, **kwargs)[0]
+    dispatched = dynamic.initialize_network(pdb_file, dcd_file, backend='networkx', **kwargs)[0]
+    for expected, metrics in zip(default, dispatched):
+        assert metrics['clustering_coefficient'] == pytest.approx(expected['clustering_coefficient'])
+        assert dict(metrics['shortest_path']) == dict(expected['shortest_path'])
+
+    with pytest.raises(ImportError):
+        dynamic.initialize_network(pdb_file, dcd_file, backend='not-installed', **kwargs)
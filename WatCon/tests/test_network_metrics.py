@@ -0,0 +1,77 @@
+"""
+Tests for graph metrics of WaterNetwork objects.
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import WatCon.generate_static_networks as static
+import WatCon.generate_dynamic_networks as dynamic
+import WatCon.residue_analysis as residue_analysis
+from WatCon.tests.conftest import water_residue, write_structure
+
+
+BOX = 14.0
+
+
+@pytest.fixture(params=['static', 'periodic'])
+def chain_triangle_point(request, tmp_path):
+    """
+    Water-water network of a chain of 4 waters, a triangle of 3 waters and an isolated water
+
+    The static version is built from a single structure, the periodic version from a frame 
+    in which the chain and the triangle are both split by the periodic boundary
+    """
+    if request.param == 'static':
+        chain = [[2.0, 2.0, 2.0], [4.8, 2.0, 2.0], [7.6, 2.0, 2.0], [10.4, 2.0, 2.0]]
+        triangle = [[5.0, 10.0, 10.0], [7.8, 10.0, 10.0], [6.4, 12.425, 10.0]]
+        point = [[12.0, 12.0, 2.0]]
+        box = None
+    else:
+        chain = [[12.6, 2.0, 2.0], [1.4, 2.0, 2.0], [4.2, 2.0, 2.0], [7.0, 2.0, 2.0]]
+        triangle = [[5.0, 13.0, 8.0], [7.8, 13.0, 8.0], [6.4, 1.425, 8.0]]
+        point = [[10.0, 7.0, 8.0]]
+        box = [BOX, BOX, BOX, 90, 90, 90]
+
+    pdb_file = write_structure(str(tmp_path / 'waters.pdb'), [water_residue(O) for O in chain + triangle + point], box=box)
+    if request.param == 'static':
+        yield static.extract_objects(pdb_file, 'water-water', None, None, False, 8.0, None, None, max_connection_distance=3.0)
+    else:
+        yield dynamic.extract_objects_per_frame(pdb_file, pdb_file, 0, 'water-water', None, None, False, 8.0, 
+                                                None, None, max_connection_distance=3.0)
+        dynamic.clear_trajectory_caches()
+
+
+def test_network_metrics(chain_triangle_point):
+    network = chain_triangle_point
+    chain, triangle, point = [0, 3, 6, 9], [12, 15, 18], [21]
+
+    assert network.graph.number_of_nodes() == 8
+    assert {frozenset(edge) for edge in network.graph.edges()} == {frozenset(edge) for edge in 
+                                                                  [(0, 3), (3, 6), (6, 9), (12, 15), (15, 18), (12, 18)]}
+    assert residue_analysis.get_interaction_counts(network) == {'water-water': 6, 'water-protein': 0}
+
+    #6 of 28 possible edges
+    assert network.get_density() == pytest.approx(6/28)
+    assert sorted(network.get_connected_components().ravel().tolist()) == [1, 3, 4]
+
+    #Chain paths average 10/6, triangle paths 1, and the isolated water counts as 0 unless excluded
+    assert network.get_CPL() == pytest.approx((5/3 + 1 + 0)/3)
+    assert network.get_CPL(exclude_single_points=True) == pytest.approx((5/3 + 1)/2)
+
+    #Degrees 0, 1 and 2 occur 1, 2 and 5 times
+    Pk = np.array([1, 2, 5])/8
+    assert network.get_entropy() == pytest.approx(-(Pk*np.log2(Pk)).sum())
+
+    expected = {**{node: 0.0 for node in chain + point}, **{node: 1.0 for node in triangle}}
+    assert network.get_clustering_coefficient() == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('module', [static, dynamic])
+@pytest.mark.parametrize('selection', ['all', 'active_region', 'not_active_region'])
+def test_clustering_coefficient_of_empty_selection(module, selection):
+    network = module.WaterNetwork()
+    network.connections = []
+    network.graph = nx.Graph()
+    assert network.get_clustering_coefficient(selection=selection) == {}
@@ -0,0 +1,135 @@
+"""
+Regression tests for water networks built from single structures.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import MDAnalysis as mda
+
+import WatCon.generate_static_networks as static
+import WatCon.residue_analysis as residue_analysis
+from WatCon.tests.conftest import water_residue, write_structure, icosahedron
+
+
+CUTOFF = 3.0
+
+
+@pytest.fixture
+def solvated_serine(tmp_path):
+    """A serine with a dense shell of 12 waters around one water, and a few waters near its polar atoms"""
+    serine = ('SER', [('N', np.array([4.0, 4.0, 4.0])), ('CA', np.array([5.2, 3.5, 4.0])), ('C', np.array([6.4, 4.0, 4.3])),
+                      ('O', np.array([6.6, 5.2, 4.3])), ('CB', np.array([5.4, 2.0, 4.0])), ('OG', np.array([6.7, 1.5, 4.2]))])
+    waters = [water_residue(O) for O in [[12.0, 12.0, 12.0], *icosahedron([12.0, 12.0, 12.0], 2.8)]]
+    waters += [water_residue(O) for O in [[2.0, 5.5, 4.0], [0.5, 7.5, 4.0], [8.5, 6.0, 4.3], [7.5, -0.8, 5.0], [9.4, 1.3, 4.0], [12.0, 4.0, 4.0]]]
+    return write_structure(str(tmp_path / 'serine.pdb'), [serine] + waters)
+
+
+def _expected_pairs(first, second, cutoff):
+    """Index pairs of two atom groups within cutoff, computed atom by atom"""
+    return {(a.index, b.index) for a in first for b in second
+            if a.index != b.index and np.sqrt(((a.position - b.position)**2).sum()) <= cutoff}
+
+
+def test_water_connections(solvated_serine):
+    network = static.extract_objects(solvated_serine, 'water-protein', None, None, False, 8.0, None, None, max_connection_distance=CUTOFF)
+    u = mda.Universe(solvated_serine)
+    oxygens = u.select_atoms('resname HOH and name O')
+    polar = u.select_atoms('protein and (name N* or name O* or name S* or name P*)')
+
+    water_pairs = {(a, b) for a, b in _expected_pairs(oxygens, oxygens, CUTOFF) if a < b}
+    protein_pairs = _expected_pairs(polar, oxygens, CUTOFF)
+
+    assert {conn[:2] for conn in network.connections if conn[3] == 'WAT-WAT'} == water_pairs
+    assert {conn[:2] for conn in network.connections if conn[3] == 'WAT-PROT'} == protein_pairs
+    assert len(network.connections) == len(water_pairs) + len(protein_pairs)
+
+    #The central water has more than 10 neighbors
+    center = oxygens[0].index
+    assert sum(center in conn[:2] for conn in network.connections) == 12
+
+    #Backbone and side chain atoms are told apart
+    names = {atm.index: atm.name for atm in polar}
+    for conn in network.connections:
+        if conn[3] == 'WAT-PROT':
+            assert conn[2] == names[conn[0]]
+            assert conn[5] == ('backbone' if conn[2] in ('N', 'O') else 'side-chain')
+
+    counts = residue_analysis.get_interaction_counts(network)
+    assert counts == {'water-water': len(water_pairs), 'water-protein': len(protein_pairs)}
+
+
+def test_water_only_connections(solvated_serine):
+    network = static.extract_objects(solvated_serine, 'water-water', None, None, False, 8.0, None, None, max_connection_distance=CUTOFF)
+    oxygens = mda.Universe(solvated_serine).select_atoms('resname HOH and name O')
+
+    assert all(conn[3] == 'WAT-WAT' for conn in network.connections)
+    assert {conn[:2] for conn in network.connections} == {(a, b) for a, b in _expected_pairs(oxygens, oxygens, CUTOFF) if a < b}
+    assert residue_analysis.get_interaction_counts(network)['water-protein'] == 0
+
+
+def test_active_region_interaction_counts(solvated_serine):
+    network = static.extract_objects(solvated_serine, 'water-protein', None, 'resid 1', False, 4.0, None, None, max_connection_distance=CUTOFF)
+
+    in_region = [conn for conn in network.connections if conn[4] == 'active_region']
+    assert {conn[3] for conn in in_region} == {'WAT-WAT', 'WAT-PROT'}
+    assert len(in_region) < len(network.connections)
+    counts = residue_analysis.get_interaction_counts(network, selection='active_region')
+    assert counts == {'water-water': sum(conn[3] == 'WAT-WAT' for conn in in_region),
+                      'water-protein': sum(conn[3] == 'WAT-PROT' for conn in in_region)}
+
+
+def test_directed_angle_criteria(tmp_path):
+    #HG donates to one water in line with OG-HG and to another at a right angle
+    OG, HG = np.array([6.7, 1.5, 4.2]), np.array([7.66, 1.5, 4.2])
+    serine = ('SER', [('N', np.array([4.0, 4.0, 4.0])), ('CA', np.array([5.2, 3.5, 4.0])), ('C', np.array([6.4, 4.0, 4.3])),
+                      ('O', np.array([6.6, 5.2, 4.3])), ('CB', np.array([5.4, 2.0, 4.0])), ('OG', OG), ('HG', HG)])
+    pdb_file = write_structure(str(tmp_path / 'serine.pdb'), [serine, water_residue(HG + [0.0, 0.0, -1.9]), water_residue(HG + [1.84, 0.0, 0.0])])
+    u = mda.Universe(pdb_file)
+
+    network = static.WaterNetwork()
+    for atm in u.select_atoms('protein'):
+        network.add_atom(atm.index, atm.name, atm.resname, *atm.position, atm.resid)
+    for mol in u.select_atoms('resname HOH').residues:
+        network.add_water(mol.resid, mol.atoms[0], mol.resid, *mol.atoms[1:])
+
+    #Indices of HG, OG and the oxygens of the two waters -- water pairs are only listed from the lower index donor
+    hg, og, w2, w1 = 6, 5, 7, 10
+    everything = {(hg, w1, 'HG', 'WAT-PROT'), (hg, w2, 'HG', 'WAT-PROT'), (w2, w1, 'H1', 'WAT-WAT'), (w2, og, 'H2', 'WAT-PROT')}
+    assert {conn[:4] for conn in network.find_directed_connections(dist_cutoff=2.5)} == everything
+
+    #Angles at the donor hydrogens are 180 (HG->w1), 90 (HG->w2), 115 (w2 H1->w1) and 96 (w2 H2->OG) degrees
+    assert {conn[:4] for conn in network.find_directed_connections(dist_cutoff=2.5, angle_criteria=120)} == {(hg, w1, 'HG', 'WAT-PROT')}
+    assert len(network.find_directed_connections(dist_cutoff=2.5, angle_criteria=110)) == 2
+
+
+def test_active_region_around_center_of_mass(solvated_serine):
+    radius = 5.0
+    network = static.extract_objects(solvated_serine, 'water-protein', None, 'resid 1', True, radius, None, None, max_connection_distance=CUTOFF)
+    u = mda.Universe(solvated_serine)
+    center = u.select_atoms('resid 1').center_of_mass()
+    oxygens = u.select_atoms('resname HOH and name O')
+
+    expected = {atm.index for atm in oxygens if np.sqrt(((atm.position - center)**2).sum()) <= radius}
+    active = {atm.O.index for atm in network.active_region if isinstance(atm, static.WaterMolecule)}
+    assert active == expected
+    assert 0 < len(active) < len(oxygens)
+
+    #A single point culls to the cube around it
+    coordinates = u.atoms.positions
+    expected_mask = (np.abs(coordinates - center) <= radius).all(axis=1)
+    assert np.array_equal(static._bounding_box_mask(coordinates, center, radius), expected_mask)
+
+
+def test_initialize_network_passes_backend(solvated_serine):
+    kwargs = dict(msa_indexing=False, classify_water=False, max_distance=CUTOFF, num_workers=1)
+    structure_directory = os.path.dirname(solvated_serine)
+    default = static.initialize_network(structure_directory, **kwargs)[0]
+    dispatched = static.initialize_network(structure_directory, backend='networkx', **kwargs)[0]
+    for expected, metrics in zip(default, dispatched):
+        assert metrics['clustering_coefficient'] == pytest.approx(expected['clustering_coefficient'])
+        assert dict(metrics['shortest_path']) == dict(expected['shortest_path'])
+
+    with pytest.raises(ImportError):
+        static.initialize_network(structure_directory, backend='not-installed', **kwargs)